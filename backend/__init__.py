@@ -3,8 +3,11 @@ import os
 from flask import Flask, jsonify
 from flask_cors import CORS
 from mongoengine import connect
-from pymongo import MongoClient
+from db import get_db
+from indexes import ensure_indexes
+from normalized_keys import backfill_all
 import cloudinary
+import uploads
 from dotenv import load_dotenv
 
 # -------------------------
@@ -23,12 +26,13 @@ from routes.attendance import attendance_bp
 from routes.assignments import assignments_bp
 from routes.classes import classes_bp
 from routes.exams import exams_bp
-from routes.marks import marks_bp
+from routes.marks import marks_bp, migrate_marks
 from routes.notices_bp import notices_bp
 from events import events_bp
 from timetables import timetables_bp
 from routes.bus_bp import bus_bp
 from routes.management import management_bp
+from routes.uploads_bp import uploads_bp
 # -------------------------
 # FLASK APP SETUP
 # -------------------------
@@ -64,10 +68,24 @@ connect(
 )
 
 # PyMongo (college_db)
-client = MongoClient(os.getenv("MONGO_COLLEGE_DB_URI"))
-db = client["college_db"]
+db = get_db("college_db")
 students_collection = db["students"]
 
+# Indexes (see indexes.py)
+if os.getenv("ENSURE_INDEXES", "1") == "1":
+    ensure_indexes()
+
+# Normalized lookup keys on documents written before they existed
+if os.getenv("STARTUP_MIGRATIONS", "1") == "1":
+    try:
+        backfill_all(only_missing=True)
+    except Exception as e:
+        print("⚠️ Normalized key backfill failed:", e)
+    try:
+        migrate_marks()
+    except Exception as e:
+        print("⚠️ Marks migration skipped:", e)
+
 # Cloudinary config
 cloudinary.config(
     cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
@@ -76,6 +94,14 @@ cloudinary.config(
     secure=True
 )
 
+# Requeue uploads a restarted worker left queued/uploading (after the config
+# above — recovered jobs start uploading right away)
+if os.getenv("STARTUP_MIGRATIONS", "1") == "1":
+    try:
+        uploads.recover()
+    except Exception as e:
+        print("⚠️ Upload recovery failed:", e)
+
 # -------------------------
 # REGISTER BLUEPRINTS
 # -------------------------
@@ -93,6 +119,7 @@ app.register_blueprint(events_bp)
 app.register_blueprint(timetables_bp)
 app.register_blueprint(bus_bp)
 app.register_blueprint(management_bp)
+app.register_blueprint(uploads_bp)
 # -------------------------
 # DEFAULT ROUTE
 # -------------------------
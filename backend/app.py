@@ -1,12 +1,19 @@
 from flask import Flask, render_template, jsonify, request
 from flask_cors import CORS
 from mongoengine import connect
-from pymongo import MongoClient, WriteConcern
+from pymongo import WriteConcern
+from db import get_db, pool_stats
+from indexes import ensure_indexes
+from normalized_keys import backfill_all
+from attendance_analytics import invalidate_reports
+from utils import norm_key
 import os
 import cloudinary
 import cloudinary.uploader
 import firebase_init
-from threading import Thread
+import uploads
+from storage import LocalStorage
+from auth.middleware import admin_required
 from flask import send_from_directory
 firebase_init.init_firebase()
 # Import blueprints
@@ -18,18 +25,21 @@ from routes.attendance import attendance_bp
 from routes.assignments import assignments_bp
 from routes.classes import classes_bp
 from routes.exams import exams_bp
-from routes.marks import marks_bp
+from routes.marks import marks_bp, migrate_marks
 from routes.notices_bp import notices_bp
 from events import events_bp
 from timetables import timetables_bp
-from models.uniform_request import create_uniform_request, get_all_requests, update_status
+from models.uniform_request import create_uniform_request, iter_requests, update_status
+from streaming import stream_json
 from routes.bus_bp import bus_bp
 from routes.management import management_bp
 from routes.fine_bp import fine_bp
+from fine_ledger import migrate_ledger
 from routes.admin_students import admin_students_bp
-from routes.notifications import notifications_bp
+from routes.notifications import notifications_bp, migrate_tokens
 from routes.attendance_pdf_routes import attendance_pdf_bp
 from routes.forms import forms_bp  # app.py backend folder me hai
+from routes.uploads_bp import uploads_bp
 # ---------------------------------------------
 # FLASK APP SETUP
 # ---------------------------------------------
@@ -59,16 +69,28 @@ CORS(
 connect(db="college", alias="db1", host=os.getenv("MONGO_COLLEGE_URI"))
 connect(db="college_db", alias="db2", host=os.getenv("MONGO_COLLEGE_DB_URI"))
 
-client = MongoClient(os.getenv("MONGO_COLLEGE_DB_URI"))
-db = client.get_database("college_db", write_concern=WriteConcern(w=1))  # safe write
+db = get_db("college_db").with_options(write_concern=WriteConcern(w=1))  # safe write
 students_collection = db["students"]
 
-# Ensure indexes for faster queries (no majority issue)
-students_collection.create_index("enrollment", background=True)
-students_collection.create_index("branch", background=True)
-students_collection.create_index("class_assigned", background=True)
-db.classes.create_index("classname", background=True)
-db.attendance.create_index([("branch", 1), ("date", 1)], background=True)
+# Ensure indexes for faster queries (full list lives in indexes.py)
+if os.getenv("ENSURE_INDEXES", "1") == "1":
+    ensure_indexes()
+
+# One-off data migrations (idempotent; STARTUP_MIGRATIONS=0 skips them)
+if os.getenv("STARTUP_MIGRATIONS", "1") == "1":
+    migrate_tokens()
+    try:
+        backfill_all(only_missing=True)   # roster/timetable lookups match on *_norm keys
+    except Exception as e:
+        print("⚠️ Normalized key backfill failed:", e)
+    try:
+        migrate_ledger()   # payments from the pre-ledger webhook → fine_balances / paidAmount
+    except Exception as e:
+        print("⚠️ Fine ledger migration failed:", e)
+    try:
+        migrate_marks()    # data/marks.json → marks collection, normalized enrollments
+    except Exception as e:
+        print("⚠️ Marks migration skipped:", e)
 
 # ---------------------------------------------
 # CLOUDINARY CONFIG
@@ -79,6 +101,14 @@ cloudinary.config(
     api_secret=os.getenv("CLOUDINARY_API_SECRET"),
     secure=True
 )
+
+# Requeue uploads a restarted worker left queued/uploading (after the config
+# above — recovered jobs start uploading right away)
+if os.getenv("STARTUP_MIGRATIONS", "1") == "1":
+    try:
+        uploads.recover()
+    except Exception as e:
+        print("⚠️ Upload recovery failed:", e)
 VAPID_PRIVATE_KEY = os.getenv("VAPID_PRIVATE_KEY")
 VAPID_PUBLIC_KEY = os.getenv("VAPID_PUBLIC_KEY")
 
@@ -90,7 +120,8 @@ for bp in [
     assignments_bp, classes_bp, class_mgmt_bp,
     events_bp, exams_bp, timetables_bp, marks_bp,
     bus_bp, management_bp, notes_bp, fine_bp,
-    admin_students_bp, notifications_bp, attendance_pdf_bp, forms_bp
+    admin_students_bp, notifications_bp, attendance_pdf_bp, forms_bp,
+    uploads_bp
 ]:
     app.register_blueprint(bp)
 
@@ -116,17 +147,17 @@ def admin_dashboard():
 # ---------------------------------------------
 # TIMETABLE UPLOAD / DELETE / FETCH (background upload)
 # ---------------------------------------------
-def async_upload(pdf, filename):
-    cloudinary.uploader.upload(pdf, public_id=filename, resource_type="raw", folder="timetables")
-
 @app.route('/upload_timetable', methods=['POST'])
 def upload_timetable():
     class_name = request.form['class_name']
     pdf = request.files['pdf']
     if pdf and pdf.filename.endswith('.pdf'):
         filename = f"{class_name}_timetable"
-        Thread(target=async_upload, args=(pdf, filename)).start()
-        return jsonify({'success': True, 'message': 'Timetable upload started!'}), 202
+        job_id = uploads.submit(
+            pdf,
+            {"public_id": filename, "resource_type": "raw", "folder": "timetables", "overwrite": True}
+        )
+        return jsonify({'success': True, 'message': 'Timetable upload started!', 'jobId': job_id}), 202
     return jsonify({'success': False, 'message': 'Invalid file type'}), 400
 
 @app.route('/delete_timetable/<class_name>', methods=['DELETE'])
@@ -180,11 +211,8 @@ def create_request():
 @app.route("/api/uniform/requests", methods=["GET"])
 def fetch_requests():
     try:
-        all_requests = get_all_requests()
-        for r in all_requests:
-            if "_id" in r:
-                r["_id"] = str(r["_id"])
-        return jsonify({"success": True, "requests": all_requests}), 200
+        # _id / created_at are encoded inline while streaming
+        return stream_json(iter_requests(), "requests", count=False)
     except Exception as e:
         print("❌ Error fetching requests:", e)
         return jsonify({"success": False, "msg": "Error fetching requests"}), 500
@@ -207,8 +235,8 @@ def modify_status(req_id):
 @app.route('/api/classes/<string:branch>/<string:class_name>/students', methods=['GET'])
 def get_students_by_branch_class(branch, class_name):
     students = list(students_collection.find(
-        {"branch": {"$regex": f"^{branch}$", "$options": "i"},
-         "class_assigned": {"$regex": f"{class_name}", "$options": "i"}},
+        {"branch_norm": norm_key(branch),
+         "class_norm": norm_key(class_name)},
         {"_id": 0, "name": 1, "enrollment": 1, "branch": 1, "class_assigned": 1}
     ))
     return jsonify({"success": True, "students": students}), 200
@@ -219,7 +247,7 @@ def update_student_class(enrollment):
     new_class = data.get("class")
     if not new_class:
         return jsonify({"success": False, "message": "Missing class"}), 400
-    result = students_collection.update_one({"enrollment": enrollment}, {"$set": {"class_assigned": new_class}})
+    result = students_collection.update_one({"enrollment": enrollment}, {"$set": {"class_assigned": new_class, "class_norm": norm_key(new_class)}})
     return jsonify({"success": result.modified_count > 0, "message": "Class updated successfully" if result.modified_count > 0 else "No changes made or enrollment not found"}), 200 if result.modified_count > 0 else 404
 
 @app.route('/api/students/<enrollment>/branch', methods=['PUT'])
@@ -228,7 +256,7 @@ def update_student_branch(enrollment):
     new_branch = data.get("branch")
     if not new_branch:
         return jsonify({"success": False, "message": "Missing branch"}), 400
-    result = students_collection.update_one({"enrollment": enrollment}, {"$set": {"branch": new_branch}})
+    result = students_collection.update_one({"enrollment": enrollment}, {"$set": {"branch": new_branch, "branch_norm": norm_key(new_branch)}})
     return jsonify({"success": result.modified_count > 0, "message": "Branch updated successfully" if result.modified_count > 0 else "No changes made or enrollment not found"}), 200 if result.modified_count > 0 else 404
 
 @app.route("/api/classes/create", methods=["POST"])
@@ -246,7 +274,7 @@ def create_class():
         prefix = start[:-3]
         start_num = int(start[-3:])
         end_num = int(end[-3:])
-        students_bulk = [{"classname": classname, "enrollment": f"{prefix}{i:03d}"} for i in range(start_num, end_num+1)]
+        students_bulk = [{"classname": classname, "classname_norm": norm_key(classname), "enrollment": f"{prefix}{i:03d}"} for i in range(start_num, end_num+1)]
         if students_bulk:
             db.students.insert_many(students_bulk)
 
@@ -279,16 +307,18 @@ def submit_attendance():
     data = request.json
     db.attendance.insert_one({
         "branch": data.get("branch"), 
+        "branch_norm": norm_key(data.get("branch")),
         "date": data["date"],
         "attendance": data["attendance"]
     })
+    invalidate_reports()
     return jsonify({"success": True, "message": "Attendance Saved"})
 
 @app.route('/api/students/<string:classname>', methods=['GET'])
 def get_students_by_classname(classname):
     try:
         students = list(students_collection.find(
-            {"classname": {"$regex": f"^{classname}$", "$options": "i"}},
+            {"classname_norm": norm_key(classname)},
             {"_id": 0, "enrollment": 1}
         ))
         return jsonify({"success": True, "students": students}), 200
@@ -312,7 +342,15 @@ def verify_salary_pwd():
 @app.route("/uploads/<path:filename>")
 def serve_uploads(filename):
     upload_root = os.path.join(os.getcwd(), "uploads")
-    return send_from_directory(upload_root, filename)
+    try:
+        return LocalStorage(upload_root).stream(filename)
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid path"}), 400
+@app.route("/api/db/pool-stats", methods=["GET"])
+@admin_required
+def db_pool_stats():
+    return jsonify({"success": True, "pools": pool_stats()}), 200
+
 @app.route("/firebase-messaging-sw.js")
 def firebase_sw():
     return send_from_directory("static/js", "firebase-messaging-sw.js")
@@ -0,0 +1,78 @@
+# assets.py
+# Content-addressed stored files with reference counts.
+#
+#   assets: {_id: "<resource_type>:<sha256>", secure_url, public_id,
+#            resource_type, bytes, storage, refs, createdAt}
+#
+# An upload whose bytes are already stored reuses the existing asset
+# (acquire → refs + 1) instead of transferring the file again. Records keep
+# the asset id next to their URL and call release() when they go away; the
+# stored file is deleted only when the last reference is released.
+from datetime import datetime
+
+from pymongo import ReturnDocument
+
+from db import db
+from storage import get_storage
+
+assets_collection = db["assets"]
+
+ASSET_FIELDS = {"_id": 0, "secure_url": 1, "public_id": 1, "resource_type": 1, "bytes": 1, "storage": 1}
+
+
+def asset_id(sha256, resource_type=None):
+    return f"{resource_type or 'image'}:{sha256}"
+
+
+def acquire(aid):
+    """Take a reference on an existing asset → its upload result, or None"""
+    return assets_collection.find_one_and_update(
+        {"_id": aid, "refs": {"$gt": 0}},
+        {"$inc": {"refs": 1}},
+        projection=ASSET_FIELDS,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def register(aid, result):
+    """
+    Record a fresh upload (refs + 1) → the asset to use. If the same bytes
+    were registered concurrently, that asset wins and the caller should
+    destroy its own copy.
+    """
+    return assets_collection.find_one_and_update(
+        {"_id": aid},
+        {
+            "$setOnInsert": {
+                "secure_url": result.get("secure_url"),
+                "public_id": result.get("public_id"),
+                "resource_type": result.get("resource_type"),
+                "bytes": result.get("bytes"),
+                "storage": result.get("storage", "cloudinary"),
+                "createdAt": datetime.utcnow()
+            },
+            "$inc": {"refs": 1}
+        },
+        upsert=True,
+        projection=ASSET_FIELDS,
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def release(aid):
+    """Drop one reference; delete the stored file on the last one → deleted?"""
+    if not aid:
+        return False
+    doc = assets_collection.find_one_and_update(
+        {"_id": aid},
+        {"$inc": {"refs": -1}},
+        return_document=ReturnDocument.AFTER
+    )
+    if not doc or doc.get("refs", 0) > 0:
+        return False
+
+    # only the caller that actually removes the document destroys the file
+    if assets_collection.delete_one({"_id": aid, "refs": {"$lte": 0}}).deleted_count:
+        get_storage(doc.get("storage", "cloudinary")).delete(doc["public_id"], doc.get("resource_type"))
+        return True
+    return False
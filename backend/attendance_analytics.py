@@ -0,0 +1,146 @@
+# attendance_analytics.py
+# Class-level attendance reports computed in MongoDB.
+#
+#   class_report("CSE", section="A", threshold=75)
+#
+# One aggregate over `attendance` (served by the {branch_norm, section, date} index)
+# groups the matching records three ways in a $facet — per student, per
+# subject (lectureId) and per date — and joins `attendance_override` for the
+# per-student figures. Students under the threshold form the defaulter list.
+#
+# Reports are cached (cache.remember) under the shared "attendance" version,
+# so every worker drops them as soon as any attendance write bumps it:
+# /mark, /edit, /edit_percentage and /api/attendance/submit call
+# invalidate_reports(). A record without a branch can't leave a stale report.
+import os
+from datetime import datetime
+
+from cache import invalidate, remember
+from db import db, long_operation
+from utils import norm_key
+from attendance_stats import summarize
+
+attendance_collection = db["attendance"]
+
+REPORT_NAMESPACE = "attendance"
+REPORT_CACHE_TTL = int(os.getenv("ATTENDANCE_REPORT_CACHE_TTL", 600))   # seconds
+DEFAULT_THRESHOLD = 75.0
+
+PRESENT = {"$sum": {"$cond": [{"$eq": ["$status", "P"]}, 1, 0]}}
+
+
+def invalidate_reports():
+    """Call after any write to attendance / attendance_override"""
+    invalidate(REPORT_NAMESPACE)
+
+
+def _match(branch, section=None, year=None, start=None, end=None, lecture_id=None):
+    match = {"branch_norm": norm_key(branch)}   # same key the cache uses
+    if section:
+        match["section"] = section
+    if year:
+        # year is copied from the student document, which may hold "2" or 2
+        match["year"] = {"$in": [year, int(year)]} if str(year).isdigit() else year
+    if start or end:
+        match["date"] = {}
+        if start:
+            match["date"]["$gte"] = start
+        if end:
+            match["date"]["$lte"] = end
+    if lecture_id:
+        match["lectureId"] = lecture_id
+    return match
+
+
+def _pipeline(match, use_override):
+    by_student = [
+        {"$group": {"_id": "$enrollment", "total": {"$sum": 1}, "present": PRESENT}},
+    ]
+    if use_override:
+        by_student.append({"$lookup": {
+            "from": "attendance_override",
+            "localField": "_id",
+            "foreignField": "enrollment",
+            "as": "override"
+        }})
+
+    return [
+        {"$match": match},
+        {"$facet": {
+            "students": by_student,
+            "subjects": [
+                {"$group": {"_id": "$lectureId", "total": {"$sum": 1}, "present": PRESENT}},
+            ],
+            "days": [
+                {"$group": {"_id": "$date", "total": {"$sum": 1}, "present": PRESENT}},
+                {"$sort": {"_id": 1}},
+            ],
+        }},
+    ]
+
+
+def _student_row(row):
+    override = (row.get("override") or [None])[0]
+    if override and override.get("total"):
+        summary = summarize(override["total"], override.get("present", 0))
+        summary["source"] = "manual"
+    else:
+        summary = summarize(row["total"], row["present"])
+        summary["source"] = "auto"
+    summary["enrollment"] = row["_id"]
+    return summary
+
+
+def compute_report(branch, section=None, year=None, start=None, end=None,
+                   lecture_id=None, threshold=DEFAULT_THRESHOLD):
+    # manual overrides are whole-term figures, so they only apply to
+    # unfiltered reports
+    use_override = not (start or end or lecture_id)
+    match = _match(branch, section, year, start, end, lecture_id)
+
+    with long_operation("report"):
+        facets = next(attendance_collection.aggregate(_pipeline(match, use_override)), {})
+
+    students = [_student_row(r) for r in facets.get("students", [])]
+    defaulters = sorted(
+        (s for s in students if s["percentage"] < threshold),
+        key=lambda s: (s["percentage"], s["enrollment"])
+    )
+
+    total = sum(s["total"] for s in facets.get("subjects", []))
+    present = sum(s["present"] for s in facets.get("subjects", []))
+
+    return {
+        "branch": branch,
+        "section": section,
+        "year": year,
+        "from": start,
+        "to": end,
+        "lectureId": lecture_id,
+        "threshold": threshold,
+        "overall": summarize(total, present),
+        "students": len(students),
+        "subjects": {
+            str(s["_id"]): summarize(s["total"], s["present"])
+            for s in facets.get("subjects", [])
+        },
+        "days": {
+            str(d["_id"]): summarize(d["total"], d["present"])
+            for d in facets.get("days", [])
+        },
+        "defaulters": defaulters,
+        "generatedAt": datetime.utcnow().isoformat()
+    }
+
+
+def class_report(branch, section=None, year=None, start=None, end=None,
+                 lecture_id=None, threshold=DEFAULT_THRESHOLD):
+    """compute_report, cached per attendance version + day + filters"""
+    today = datetime.utcnow().strftime("%Y-%m-%d")
+    key = "|".join(str(v or "") for v in (today, norm_key(branch), section, year, start, end, lecture_id, threshold))
+    return remember(
+        REPORT_NAMESPACE,
+        key,
+        lambda: compute_report(branch, section, year, start, end, lecture_id, threshold),
+        REPORT_CACHE_TTL
+    )
@@ -0,0 +1,263 @@
+# attendance_bitmaps.py
+# Compact per-lecture attendance: one document per (class, date, lecture).
+#
+#   attendance_rosters:  {_id: <class key>, enrollments: [...]}      fixed order
+#   attendance_bitmaps:  {class, date, lectureId, size,
+#                         marked: <bits>, present: <bits>, version}
+#
+# Bit i of `marked` / `present` belongs to roster position i (little-endian
+# within each byte). Students are only ever appended to a roster, so old
+# bitmaps keep lining up. A 60-student lecture is ~16 bytes of flags instead
+# of 60 raw documents, and a semester summary reads one small document per
+# lecture and sums them with numpy.unpackbits.
+#
+# Raw `attendance` stays the source of truth; set ATTENDANCE_BITMAPS=1 to
+# maintain bitmaps from /mark and /edit, and run `python attendance_bitmaps.py`
+# to build them from existing records.
+import os
+
+from bson import Binary
+from pymongo import ReplaceOne, ReturnDocument
+
+from db import db, long_operation
+from utils import norm_key
+from attendance_stats import summarize
+
+attendance_collection = db["attendance"]
+rosters_collection = db["attendance_rosters"]
+bitmaps_collection = db["attendance_bitmaps"]
+
+ENABLED = os.getenv("ATTENDANCE_BITMAPS", "0") == "1"
+CAS_RETRIES = 5
+
+
+# -------------------- ENCODING --------------------
+def class_key(branch, year, section):
+    return "-".join(norm_key(v) or "_" for v in (year, branch, section))
+
+
+def encode(positions, size):
+    """Set of roster positions → packed bytes"""
+    buf = bytearray((size + 7) // 8)
+    for i in positions:
+        buf[i >> 3] |= 1 << (i & 7)
+    return bytes(buf)
+
+
+def decode(data):
+    """Packed bytes → sorted list of set roster positions"""
+    bits = int.from_bytes(data or b"", "little")
+    out = []
+    while bits:
+        low = bits & -bits
+        out.append(low.bit_length() - 1)
+        bits ^= low
+    return out
+
+
+def popcount(data):
+    return int.from_bytes(data or b"", "little").bit_count()
+
+
+# -------------------- ROSTERS --------------------
+def roster(key):
+    doc = rosters_collection.find_one({"_id": key}, {"enrollments": 1})
+    return doc["enrollments"] if doc else []
+
+
+def roster_positions(key, enrollments):
+    """{enrollment: position}, appending unseen students to the roster"""
+    doc = rosters_collection.find_one_and_update(
+        {"_id": key},
+        {"$addToSet": {"enrollments": {"$each": list(enrollments)}}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER
+    )
+    return {e: i for i, e in enumerate(doc["enrollments"])}
+
+
+# -------------------- WRITES --------------------
+def _set_bits(key, date, lecture_id, statuses):
+    """Merge {enrollment: "P"|"A"} into one lecture bitmap (compare-and-swap)"""
+    positions = roster_positions(key, statuses)
+    size = len(positions)
+    query = {"class": key, "date": date, "lectureId": lecture_id}
+
+    for _ in range(CAS_RETRIES):
+        doc = bitmaps_collection.find_one(query) or {}
+        marked = int.from_bytes(doc.get("marked", b""), "little")
+        present = int.from_bytes(doc.get("present", b""), "little")
+
+        for enrollment, status in statuses.items():
+            bit = 1 << positions[enrollment]
+            marked |= bit
+            present = present | bit if status == "P" else present & ~bit
+
+        nbytes = (size + 7) // 8
+        update = {
+            **query,
+            "size": size,
+            "marked": Binary(marked.to_bytes(nbytes, "little")),
+            "present": Binary(present.to_bytes(nbytes, "little")),
+            "version": doc.get("version", 0) + 1
+        }
+        if doc:
+            result = bitmaps_collection.replace_one({"_id": doc["_id"], "version": doc.get("version", 0)}, update)
+            if result.modified_count:
+                return True
+        else:
+            try:
+                bitmaps_collection.insert_one(update)
+                return True
+            except Exception:
+                pass   # someone else created it first — retry as an update
+    print(f"⚠️ Bitmap update gave up for {key} {date} {lecture_id}")
+    return False
+
+
+def record_marks(students, statuses, date, lecture_id):
+    """
+    students: {enrollment: {branch, year, section}}
+    statuses: {enrollment: "P"|"A"} (only enrollments present in students)
+    """
+    if not ENABLED:
+        return
+    groups = {}
+    for enrollment, status in statuses.items():
+        s = students.get(enrollment)
+        if s is None:
+            continue
+        key = class_key(s.get("branch"), s.get("year"), s.get("section"))
+        groups.setdefault(key, {})[enrollment] = status
+
+    for key, group in groups.items():
+        try:
+            _set_bits(key, date, lecture_id, group)
+        except Exception as e:
+            print(f"⚠️ Bitmap write failed for {key}:", e)
+
+
+# -------------------- SUMMARIES --------------------
+def class_summary(branch, year, section, start=None, end=None, lecture_id=None):
+    """
+    Per-student / per-subject / per-day totals for one class from its bitmaps.
+    One roster read + one cursor over the matching lecture documents.
+    """
+    import numpy as np
+
+    key = class_key(branch, year, section)
+    enrollments = roster(key)
+    size = len(enrollments)
+    nbytes = (size + 7) // 8
+
+    query = {"class": key}
+    if start or end:
+        query["date"] = {}
+        if start:
+            query["date"]["$gte"] = start
+        if end:
+            query["date"]["$lte"] = end
+    if lecture_id:
+        query["lectureId"] = lecture_id
+
+    marked_rows, present_rows = [], []
+    subjects, days = {}, {}
+    for doc in bitmaps_collection.find(query, {"_id": 0, "date": 1, "lectureId": 1, "marked": 1, "present": 1}):
+        marked = bytes(doc.get("marked", b"")).ljust(nbytes, b"\0")[:nbytes]
+        present = bytes(doc.get("present", b"")).ljust(nbytes, b"\0")[:nbytes]
+        marked_rows.append(marked)
+        present_rows.append(present)
+
+        t, p = popcount(marked), popcount(present)
+        for bucket, name in ((subjects, str(doc.get("lectureId"))), (days, doc.get("date"))):
+            b = bucket.setdefault(name, [0, 0])
+            b[0] += t
+            b[1] += p
+
+    if marked_rows and size:
+        def per_student(rows):
+            matrix = np.frombuffer(b"".join(rows), dtype=np.uint8).reshape(len(rows), nbytes)
+            return np.unpackbits(matrix, axis=1, bitorder="little")[:, :size].sum(axis=0)
+        totals = per_student(marked_rows)
+        presents = per_student(present_rows)
+    else:
+        totals = presents = [0] * size
+
+    students = {
+        e: summarize(int(t), int(p))
+        for e, t, p in zip(enrollments, totals, presents)
+        if t
+    }
+    return {
+        "class": key,
+        "lectures": len(marked_rows),
+        "overall": summarize(
+            sum(s["total"] for s in students.values()),
+            sum(s["present"] for s in students.values())
+        ),
+        "students": students,
+        "subjects": {k: summarize(*v) for k, v in subjects.items()},
+        "days": {k: summarize(*v) for k, v in sorted(days.items())},
+    }
+
+
+# -------------------- BACKFILL --------------------
+def rebuild(batch_size=500):
+    """Build every bitmap from the raw attendance collection"""
+    with long_operation():
+        return _rebuild(batch_size)
+
+
+def _rebuild(batch_size=500):
+    pipeline = [
+        {"$match": {"enrollment": {"$exists": True}, "date": {"$exists": True}}},
+        {"$sort": {"markedAt": 1}},
+        {"$group": {
+            "_id": {
+                "branch": "$branch", "year": "$year", "section": "$section",
+                "date": "$date", "lectureId": "$lectureId"
+            },
+            "marks": {"$push": {"enrollment": "$enrollment", "status": "$status"}}
+        }}
+    ]
+
+    positions = {}
+    ops = []
+    written = 0
+    for row in attendance_collection.aggregate(pipeline, allowDiskUse=True):
+        g = row["_id"]
+        key = class_key(g.get("branch"), g.get("year"), g.get("section"))
+        statuses = {m["enrollment"]: m.get("status") for m in row["marks"]}
+
+        if key not in positions or any(e not in positions[key] for e in statuses):
+            positions[key] = roster_positions(key, sorted(statuses))
+        pos = positions[key]
+        size = len(pos)
+
+        ops.append(ReplaceOne(
+            {"class": key, "date": g.get("date"), "lectureId": g.get("lectureId")},
+            {
+                "class": key,
+                "date": g.get("date"),
+                "lectureId": g.get("lectureId"),
+                "size": size,
+                "marked": Binary(encode((pos[e] for e in statuses), size)),
+                "present": Binary(encode((pos[e] for e, s in statuses.items() if s == "P"), size)),
+                "version": 1
+            },
+            upsert=True
+        ))
+        if len(ops) >= batch_size:
+            bitmaps_collection.bulk_write(ops, ordered=False)
+            written += len(ops)
+            ops = []
+
+    if ops:
+        bitmaps_collection.bulk_write(ops, ordered=False)
+        written += len(ops)
+    return written
+
+
+if __name__ == "__main__":
+    count = rebuild()
+    print(f"✅ Built {count} attendance bitmaps")
@@ -0,0 +1,178 @@
+# attendance_stats.py
+# Per-enrollment attendance rollups.
+#
+# One document per student in `attendance_stats`:
+#   {enrollment, total, present,
+#    subjects: {<lectureId>: {total, present}},
+#    months:   {<YYYY-MM>:   {total, present}}}
+#
+# /mark and /edit keep it in sync with $inc, dashboards read it with one
+# indexed lookup. Run `python attendance_stats.py` to backfill it from the
+# raw `attendance` collection.
+from pymongo import UpdateOne, ReplaceOne
+from db import db, long_operation
+
+attendance_collection = db["attendance"]
+stats_collection = db["attendance_stats"]
+
+
+def _key(value):
+    """Mongo field names can't carry '.' or '$'"""
+    return str(value or "unknown").replace(".", "_").replace("$", "_")
+
+
+def stats_update(enrollment, date, lecture_id, d_total, d_present):
+    """Build the $inc for one attendance change (None if nothing moved)"""
+    if not d_total and not d_present:
+        return None
+
+    subject = f"subjects.{_key(lecture_id)}"
+    month = f"months.{_key((date or '')[:7])}"
+
+    return UpdateOne(
+        {"enrollment": enrollment},
+        {"$inc": {
+            "total": d_total,
+            "present": d_present,
+            f"{subject}.total": d_total,
+            f"{subject}.present": d_present,
+            f"{month}.total": d_total,
+            f"{month}.present": d_present
+        }},
+        upsert=True
+    )
+
+
+def apply_changes(ops):
+    ops = [op for op in ops if op is not None]
+    if ops:
+        stats_collection.bulk_write(ops, ordered=False)
+
+
+def summarize(total, present):
+    return {
+        "total": total,
+        "present": present,
+        "absent": total - present,
+        "percentage": round((present / total) * 100, 2) if total else 0
+    }
+
+
+def read_stats(enrollment):
+    """
+    Rollup for one student, or None if no rollup exists yet
+    (caller decides whether to fall back to counting raw records)
+    """
+    doc = stats_collection.find_one({"enrollment": enrollment}, {"_id": 0})
+    if not doc:
+        return None
+
+    summary = summarize(doc.get("total", 0), doc.get("present", 0))
+    summary["subjects"] = {
+        k: summarize(v.get("total", 0), v.get("present", 0))
+        for k, v in doc.get("subjects", {}).items()
+    }
+    summary["months"] = {
+        k: summarize(v.get("total", 0), v.get("present", 0))
+        for k, v in doc.get("months", {}).items()
+    }
+    return summary
+
+
+def count_raw(enrollment):
+    """Slow path — only used until the rollup has been backfilled"""
+    total = attendance_collection.count_documents({"enrollment": enrollment})
+    present = attendance_collection.count_documents({
+        "enrollment": enrollment,
+        "status": "P"
+    })
+    return summarize(total, present)
+
+
+def get_summary(enrollment):
+    return read_stats(enrollment) or count_raw(enrollment)
+
+
+def get_summaries(enrollments):
+    """
+    Totals for many students at once: one $in over the rollups, plus one
+    $group over raw records for anyone not backfilled yet
+    """
+    enrollments = list(enrollments)
+    out = {
+        d["enrollment"]: summarize(d.get("total", 0), d.get("present", 0))
+        for d in stats_collection.find(
+            {"enrollment": {"$in": enrollments}},
+            {"_id": 0, "enrollment": 1, "total": 1, "present": 1}
+        )
+    }
+
+    missing = [e for e in enrollments if e not in out]
+    if missing:
+        for row in attendance_collection.aggregate([
+            {"$match": {"enrollment": {"$in": missing}}},
+            {"$group": {
+                "_id": "$enrollment",
+                "total": {"$sum": 1},
+                "present": {"$sum": {"$cond": [{"$eq": ["$status", "P"]}, 1, 0]}}
+            }}
+        ]):
+            out[row["_id"]] = summarize(row["total"], row["present"])
+
+    for e in missing:
+        out.setdefault(e, summarize(0, 0))
+
+    return out
+
+
+def rebuild(batch_size=1000):
+    """Recompute every rollup from the raw attendance collection"""
+    with long_operation():
+        return _rebuild(batch_size)
+
+
+def _rebuild(batch_size=1000):
+    pipeline = [
+        {"$match": {"enrollment": {"$exists": True}}},
+        {"$group": {
+            "_id": {
+                "enrollment": "$enrollment",
+                "lecture": "$lectureId",
+                "month": {"$substrCP": [{"$ifNull": ["$date", ""]}, 0, 7]}
+            },
+            "total": {"$sum": 1},
+            "present": {"$sum": {"$cond": [{"$eq": ["$status", "P"]}, 1, 0]}}
+        }}
+    ]
+
+    docs = {}
+    for row in attendance_collection.aggregate(pipeline, allowDiskUse=True):
+        g = row["_id"]
+        doc = docs.setdefault(g["enrollment"], {
+            "enrollment": g["enrollment"],
+            "total": 0,
+            "present": 0,
+            "subjects": {},
+            "months": {}
+        })
+        doc["total"] += row["total"]
+        doc["present"] += row["present"]
+
+        for bucket, key in (("subjects", _key(g.get("lecture"))), ("months", _key(g.get("month")))):
+            b = doc[bucket].setdefault(key, {"total": 0, "present": 0})
+            b["total"] += row["total"]
+            b["present"] += row["present"]
+
+    ops = [ReplaceOne({"enrollment": e}, d, upsert=True) for e, d in docs.items()]
+    for i in range(0, len(ops), batch_size):
+        stats_collection.bulk_write(ops[i:i + batch_size], ordered=False)
+
+    # drop rollups for students that no longer have any records
+    stats_collection.delete_many({"enrollment": {"$nin": list(docs)}})
+
+    return len(docs)
+
+
+if __name__ == "__main__":
+    count = rebuild()
+    print(f"✅ Rebuilt attendance stats for {count} students")
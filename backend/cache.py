@@ -0,0 +1,188 @@
+# cache.py
+# Read-through response cache for hot GET endpoints.
+#
+#   @cached("notices")          → cache the body per path + query string + format
+#                                 (streamed responses are never cached)
+#   invalidate("notices")       → call from the write routes
+#
+# Invalidation bumps the namespace's shared counter in `collection_versions`
+# (versions.bump), and that counter is part of every key, so old entries stop
+# being reachable in every worker at once (and age out via TTL/LRU). The key
+# therefore always matches the version ETag that @conditional sends.
+#
+# Backend: in-process LRU by default (one per gunicorn worker). Set
+# CACHE_REDIS_URL to share one cache between workers (needs
+# `pip install redis`). Tests can swap in any object with get/set via
+# set_backend().
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+from functools import wraps
+from threading import Lock
+
+from flask import request, make_response, Response
+
+from streaming import wants_ndjson
+from versions import bump, version
+
+CACHE_TTL = int(os.getenv("CACHE_TTL", 30))            # seconds
+CACHE_MAX_ENTRIES = int(os.getenv("CACHE_MAX_ENTRIES", 2048))
+
+
+# -------------------- BACKENDS --------------------
+class LRUBackend:
+    """Thread-safe in-process LRU with per-entry expiry"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.data = OrderedDict()
+        self.lock = Lock()
+
+    def get(self, key):
+        with self.lock:
+            item = self.data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires and expires < time.monotonic():
+                del self.data[key]
+                return None
+            self.data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        with self.lock:
+            expires = time.monotonic() + ttl if ttl else None
+            self.data[key] = (value, expires)
+            self.data.move_to_end(key)
+            while len(self.data) > self.max_entries:
+                self.data.popitem(last=False)
+
+
+class RedisBackend:
+    """Shared cache across workers/instances"""
+
+    def __init__(self, url):
+        import redis   # optional dependency
+        self.client = redis.Redis.from_url(url)
+
+    def get(self, key):
+        raw = self.client.get(key)
+        return json.loads(raw) if raw is not None else None
+
+    def set(self, key, value, ttl=None):
+        self.client.set(key, json.dumps(value), ex=ttl)
+
+
+def _default_backend():
+    url = os.getenv("CACHE_REDIS_URL")
+    if url:
+        try:
+            return RedisBackend(url)
+        except Exception as e:
+            print("⚠️ Redis cache unavailable, using in-process LRU:", e)
+    return LRUBackend()
+
+
+backend = _default_backend()
+
+
+def set_backend(new_backend):
+    global backend
+    backend = new_backend
+
+
+# -------------------- API --------------------
+def _generation(namespace):
+    return version(namespace)
+
+
+def invalidate(*namespaces):
+    """Drop every cached response of these namespaces (in every worker)"""
+    bump(*namespaces)
+
+
+def remember(namespace, key, compute, ttl=None):
+    """
+    Read-through cache for a computed (JSON-serializable) value rather than a
+    whole response. Shares the namespace generation with invalidate().
+    """
+    full_key = None
+    try:
+        full_key = f"data:{namespace}:{_generation(namespace)}:{key}"
+        hit = backend.get(full_key)
+        if hit is not None:
+            return hit
+    except Exception as e:
+        print("⚠️ Cache read failed:", e)
+
+    value = compute()
+    if full_key is not None:
+        try:
+            backend.set(full_key, value, ttl or CACHE_TTL)
+        except Exception as e:
+            print("⚠️ Cache write failed:", e)
+    return value
+
+
+def etag_for(body):
+    return '"' + hashlib.sha1(body).hexdigest() + '"'
+
+
+def _conditional(body, mimetype, etag, status=200):
+    if etag.strip('"') in request.if_none_match:
+        resp = Response(status=304)
+    else:
+        resp = Response(body, status=status, mimetype=mimetype)
+    resp.set_etag(etag.strip('"'))
+    resp.headers["Cache-Control"] = "no-cache"   # always revalidate, 304 is cheap
+    resp.vary.add("Accept")
+    return resp
+
+
+def cached(namespace, ttl=None):
+    """
+    Cache successful GET responses of a route, keyed by
+    namespace + path + query string + JSON/NDJSON, with ETag / 304 support.
+    Streamed responses (stream_json) pass through uncached — buffering them
+    here would hold the whole listing in memory before the first byte.
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return f(*args, **kwargs)
+
+            query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+            key = None
+            try:
+                fmt = "ndjson" if wants_ndjson() else "json"
+                key = f"resp:{namespace}:{_generation(namespace)}:{fmt}:{request.path}?{query}"
+                hit = backend.get(key)
+            except Exception as e:
+                print("⚠️ Cache read failed:", e)
+                hit = None
+
+            if hit:
+                return _conditional(hit["body"].encode(), hit["mimetype"], hit["etag"])
+
+            resp = make_response(f(*args, **kwargs))
+            if resp.status_code != 200 or resp.is_streamed or resp.direct_passthrough or key is None:
+                return resp
+
+            body = resp.get_data()
+            etag = etag_for(body)
+            try:
+                backend.set(key, {
+                    "body": body.decode(),
+                    "mimetype": resp.mimetype,
+                    "etag": etag
+                }, ttl or CACHE_TTL)
+            except Exception as e:
+                print("⚠️ Cache write failed:", e)
+
+            return _conditional(body, resp.mimetype, etag)
+        return wrapper
+    return decorator
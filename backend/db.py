@@ -1,4 +1,7 @@
-from pymongo import MongoClient
+import pymongo
+from pymongo import MongoClient, ReadPreference
+from pymongo.monitoring import ConnectionPoolListener
+from threading import Lock
 import os
 
 # --------------------------------------------------------
@@ -6,21 +9,170 @@ import os
 # --------------------------------------------------------
 # Your environment variable name:
 MONGO_URI = os.getenv("MONGO_COLLEGE_DB_URI")
+LOCAL_URI = "mongodb://localhost:27017"
 
 # --------------------------------------------------------
 # 🔄 2. Fallback to local MongoDB if ENV not found
 # --------------------------------------------------------
 if not MONGO_URI:
     print("⚠️ WARNING: MONGO_COLLEGE_DB_URI not found. Using LOCAL MongoDB...")
-    MONGO_URI = "mongodb://localhost:27017"
+    MONGO_URI = LOCAL_URI
 else:
     print("✅ Loaded MongoDB URI from environment (Production Mode)")
 
 # --------------------------------------------------------
-# 🚀 3. Connect to MongoDB (Atlas or Local)
+# 🗂 3. Named database handles
+# --------------------------------------------------------
+# name -> (env var holding the URI, database name)
+# Handles that point at the same URI share ONE client / pool.
+DATABASES = {
+    "college_db": ("MONGO_COLLEGE_DB_URI", "college_db"),
+    "users": ("MONGO_URL", "users"),
+    "classes": ("MONGO_URL", "classes"),
+    "college": ("MONGO_COLLEGE_URI", "college"),
+    "school": ("MONGO_SCHOOL_URI", "schoolDB"),
+}
+
+# Pool settings (per process / gunicorn worker)
+POOL_OPTIONS = {
+    "maxPoolSize": int(os.getenv("MONGO_MAX_POOL_SIZE", 20)),
+    "minPoolSize": int(os.getenv("MONGO_MIN_POOL_SIZE", 0)),
+    "maxIdleTimeMS": int(os.getenv("MONGO_MAX_IDLE_TIME_MS", 60000)),
+    "connectTimeoutMS": int(os.getenv("MONGO_CONNECT_TIMEOUT_MS", 10000)),
+    "serverSelectionTimeoutMS": int(os.getenv("MONGO_SERVER_SELECTION_TIMEOUT_MS", 10000)),
+    "socketTimeoutMS": int(os.getenv("MONGO_SOCKET_TIMEOUT_MS", 30000)),
+}
+
+# Longer deadlines for work that legitimately runs past socketTimeoutMS
+# (see long_operation below), in seconds
+OPERATION_TIMEOUTS = {
+    "report": float(os.getenv("MONGO_REPORT_TIMEOUT_S", 120)),    # analytics aggregations
+    "job": float(os.getenv("MONGO_JOB_TIMEOUT_S", 1800)),         # rebuilds / backfills
+}
+
+# Read preference per workload, e.g. reports can go to secondaries
+READ_PREFERENCES = {
+    "primary": ReadPreference.PRIMARY,
+    "primaryPreferred": ReadPreference.PRIMARY_PREFERRED,
+    "secondary": ReadPreference.SECONDARY,
+    "secondaryPreferred": ReadPreference.SECONDARY_PREFERRED,
+    "nearest": ReadPreference.NEAREST,
+}
+
+
+class PoolStats(ConnectionPoolListener):
+    """Counts pool events so we can see how busy each client is"""
+
+    def __init__(self):
+        self.lock = Lock()
+        self.counts = {
+            "created": 0,
+            "closed": 0,
+            "checked_out": 0,
+            "checked_in": 0,
+            "checkout_failed": 0,
+            "pools_cleared": 0,
+        }
+
+    def _bump(self, key):
+        with self.lock:
+            self.counts[key] += 1
+
+    def pool_created(self, event): pass
+    def pool_ready(self, event): pass
+    def pool_closed(self, event): pass
+    def pool_cleared(self, event): self._bump("pools_cleared")
+    def connection_created(self, event): self._bump("created")
+    def connection_ready(self, event): pass
+    def connection_closed(self, event): self._bump("closed")
+    def connection_check_out_started(self, event): pass
+    def connection_check_out_failed(self, event): self._bump("checkout_failed")
+    def connection_checked_out(self, event): self._bump("checked_out")
+    def connection_checked_in(self, event): self._bump("checked_in")
+
+    def snapshot(self):
+        with self.lock:
+            c = dict(self.counts)
+        c["open"] = c["created"] - c["closed"]
+        c["in_use"] = c["checked_out"] - c["checked_in"]
+        return c
+
+
+_clients = {}   # uri -> (MongoClient, PoolStats)
+_lock = Lock()
+
+
+def _uri_for(name):
+    env_name, _ = DATABASES[name]
+    return os.getenv(env_name) or LOCAL_URI
+
+
+def get_client(uri=None):
+    """Shared MongoClient for a URI (created once per process)"""
+    uri = uri or MONGO_URI
+    with _lock:
+        if uri not in _clients:
+            stats = PoolStats()
+            _clients[uri] = (
+                MongoClient(uri, event_listeners=[stats], **POOL_OPTIONS),
+                stats,
+            )
+        return _clients[uri][0]
+
+
+def get_db(name="college_db", read_preference=None):
+    """
+    Named database handle from the shared pool.
+    read_preference: "primary" / "secondaryPreferred" / ... — falls back to
+    MONGO_READ_PREFERENCE_<NAME>, then primary.
+    """
+    if name not in DATABASES:
+        raise KeyError(f"Unknown database handle: {name}")
+
+    _, db_name = DATABASES[name]
+    mode = read_preference or os.getenv(f"MONGO_READ_PREFERENCE_{name.upper()}", "primary")
+
+    return get_client(_uri_for(name)).get_database(
+        db_name,
+        read_preference=READ_PREFERENCES.get(mode, ReadPreference.PRIMARY)
+    )
+
+
+def long_operation(kind="job"):
+    """
+    Deadline for a block of slow operations instead of the pool-wide
+    socketTimeoutMS (pymongo applies the remaining block time per socket).
+    Rebuilds, backfills and report aggregations over big collections run
+    well past the 30 s default, so they go through this:
+
+        with long_operation("report"):
+            coll.aggregate(...)
+    """
+    return pymongo.timeout(OPERATION_TIMEOUTS[kind])
+
+
+def pool_stats():
+    """Per-client pool counters (URIs masked — they carry credentials)"""
+    with _lock:
+        items = list(_clients.items())
+
+    out = []
+    for uri, (c, stats) in items:
+        host = uri.split("@")[-1].split("/")[0]
+        out.append({
+            "host": host,
+            "handles": [n for n in DATABASES if _uri_for(n) == uri],
+            "maxPoolSize": POOL_OPTIONS["maxPoolSize"],
+            **stats.snapshot()
+        })
+    return out
+
+
+# --------------------------------------------------------
+# 🚀 4. Connect to MongoDB (Atlas or Local)
 # --------------------------------------------------------
 try:
-    client = MongoClient(MONGO_URI)
+    client = get_client(MONGO_URI)
     db = client["college_db"]  # Database auto-created if not exist
     print("✅ MongoDB connected successfully")
 except Exception as e:
@@ -3,6 +3,10 @@ from db import db
 from utils import generate_id
 from flask_cors import cross_origin, CORS
 from datetime import datetime
+from cache import cached, invalidate
+from versions import conditional
+from streaming import stream_json
+from pagination import Page, PageError, page_args
 
 # 🔔 Notification helper
 from routes.notifications import send_global
@@ -16,9 +20,16 @@ CORS(events_bp, resources={r"/*": {"origins": "*"}})
 # ---------------------------------------------------------
 @events_bp.route('', methods=['GET'])
 @cross_origin()
+@conditional("events")
+@cached("events")
 def get_all_events():
-    events = list(db.events.find({}, {"_id": 0}))
-    return jsonify({"success": True, "events": events}), 200
+    try:
+        args = page_args(request.args)
+    except PageError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    page = Page(db.events, {}, {"_id": 0}, args)
+    return stream_json(page, "events", tail=lambda: {"next_cursor": page.next_cursor})
 
 
 # ---------------------------------------------------------
@@ -26,6 +37,8 @@ def get_all_events():
 # ---------------------------------------------------------
 @events_bp.route('/<eventId>', methods=['GET'])
 @cross_origin()
+@conditional("events")
+@cached("events")
 def get_event(eventId):
     event = db.events.find_one({"eventId": eventId}, {"_id": 0})
     if not event:
@@ -66,6 +79,7 @@ def post_event():
 
     try:
         db.events.insert_one(event_doc)
+        invalidate("events")
     except Exception as e:
         print("DB Insert Error:", e)
         return jsonify({"success": False, "message": "Database error occurred"}), 500
@@ -95,6 +109,7 @@ def delete_event(eventId):
 
     try:
         db.events.delete_one({"eventId": eventId})
+        invalidate("events")
     except Exception as e:
         print("DB Delete Error:", e)
         return jsonify({"success": False, "message": "Database error occurred"}), 500
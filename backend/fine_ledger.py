@@ -0,0 +1,183 @@
+# fine_ledger.py
+# Settle Razorpay payments against fines.
+#
+#   payment_transactions  one document per razorpay_payment_id (unique index)
+#                         → a redelivered webhook is a no-op
+#   fine_balances         {enrollment, paid, credit, payments, updatedAt}
+#                         running totals, kept with $inc
+#   fine                  each fine gets paidAmount + status (Unpaid/Partial/Paid)
+#
+# A payment (plus any credit left from earlier overpayment) is allocated to
+# the student's open fines oldest first; whatever is left becomes credit.
+# Everything happens in one transaction, and the work depends only on the
+# student's open fines, never on how many payments they made before.
+#
+# Payments recorded by the old webhook (no `allocations`) predate the ledger;
+# migrate_ledger() replays them once so those students aren't billed again.
+from datetime import datetime
+
+from pymongo import ASCENDING, ReturnDocument
+from pymongo.errors import DuplicateKeyError, OperationFailure
+
+from db import db
+
+fines_collection = db["fine"]
+transactions_collection = db["payment_transactions"]
+balances_collection = db["fine_balances"]
+
+
+class AlreadySettled(Exception):
+    pass
+
+
+def fine_status(amount, paid):
+    if paid <= 0:
+        return "Unpaid"
+    return "Paid" if paid >= amount else "Partial"
+
+
+def _settle(session, enrollment, amount, payment):
+    now = datetime.now()
+
+    # 🔹 1. record the payment — duplicate id means already settled
+    try:
+        transactions_collection.insert_one({
+            "enrollment": enrollment,
+            "amount_paid": amount,
+            "razorpay_payment_id": payment["id"],
+            "razorpay_order_id": payment.get("order_id"),
+            "status": "success",
+            "createdAt": now
+        }, session=session)
+    except DuplicateKeyError:
+        raise AlreadySettled(payment["id"])
+
+    # 🔹 2. running balance
+    balance = balances_collection.find_one_and_update(
+        {"enrollment": enrollment},
+        {"$inc": {"paid": amount, "payments": 1}, "$set": {"updatedAt": now}},
+        upsert=True,
+        return_document=ReturnDocument.AFTER,
+        session=session
+    )
+    available = amount + balance.get("credit", 0)
+
+    # 🔹 3. allocate to open fines, oldest first
+    allocations = []
+    open_fines = fines_collection.find(
+        {"enrollment": enrollment, "status": {"$ne": "Paid"}},
+        {"fine": 1, "paidAmount": 1},
+        session=session
+    ).sort("createdAt", ASCENDING)
+
+    for fine in open_fines:
+        if available <= 0:
+            break
+        total = int(fine.get("fine", 0))
+        already = int(fine.get("paidAmount", 0))
+        share = min(available, total - already)
+        if share <= 0:
+            continue
+
+        fines_collection.update_one(
+            {"_id": fine["_id"]},
+            {"$inc": {"paidAmount": share},
+             "$set": {"status": fine_status(total, already + share), "updatedAt": now}},
+            session=session
+        )
+        allocations.append({"fineId": str(fine["_id"]), "amount": share})
+        available -= share
+
+    # 🔹 4. leftover becomes credit
+    balances_collection.update_one(
+        {"enrollment": enrollment},
+        {"$inc": {"credit": available - balance.get("credit", 0)}},
+        session=session
+    )
+    transactions_collection.update_one(
+        {"razorpay_payment_id": payment["id"]},
+        {"$set": {"allocations": allocations, "credit": available}},
+        session=session
+    )
+    return {"allocations": allocations, "credit": available}
+
+
+def _transaction(work):
+    """work(session) in one transaction, or without a session on a standalone mongod"""
+    try:
+        with db.client.start_session() as session:
+            return session.with_transaction(work)
+    except OperationFailure as e:
+        # standalone mongod (local dev) has no transactions; the unique
+        # payment id still keeps redeliveries from double-counting
+        if e.code != 20:
+            raise
+        print("⚠️ Transactions unavailable, running without one:", e)
+        return work(None)
+
+
+def settle_payment(enrollment, amount, payment):
+    """
+    Apply one captured payment. Returns {"allocations", "credit"},
+    or None if this payment id was already settled.
+    """
+    if transactions_collection.find_one({"razorpay_payment_id": payment["id"]}, {"_id": 1}):
+        return None
+
+    try:
+        return _transaction(lambda s: _settle(s, enrollment, amount, payment))
+    except AlreadySettled:
+        return None
+
+
+# -------------------- MIGRATION --------------------
+LEGACY = {"allocations": {"$exists": False}, "ledgerReplayedAt": {"$exists": False}}
+
+
+def _replay(session, enrollment):
+    """Rebuild one student's balance and per-fine paidAmount from all their payments"""
+    now = datetime.now()
+    payments = list(transactions_collection.find(
+        {"enrollment": enrollment, "status": "success"}, {"amount_paid": 1}, session=session
+    ))
+    paid = sum(int(t.get("amount_paid", 0)) for t in payments)
+
+    available = paid
+    fines = fines_collection.find(
+        {"enrollment": enrollment}, {"fine": 1}, session=session
+    ).sort("createdAt", ASCENDING)
+    for fine in fines:
+        total = int(fine.get("fine", 0))
+        share = max(0, min(available, total))
+        fines_collection.update_one(
+            {"_id": fine["_id"]},
+            {"$set": {"paidAmount": share, "status": fine_status(total, share), "updatedAt": now}},
+            session=session
+        )
+        available -= share
+
+    balances_collection.update_one(
+        {"enrollment": enrollment},
+        {"$set": {"paid": paid, "payments": len(payments), "credit": available, "updatedAt": now}},
+        upsert=True,
+        session=session
+    )
+    transactions_collection.update_many(
+        {"enrollment": enrollment, **LEGACY},
+        {"$set": {"ledgerReplayedAt": now}},
+        session=session
+    )
+
+
+def migrate_ledger():
+    """
+    Replay payments taken before the ledger existed (idempotent) → number of
+    students migrated. Each student is recomputed from scratch, so payments
+    already settled through the ledger are counted exactly once.
+    """
+    enrollments = [e for e in transactions_collection.distinct("enrollment", LEGACY) if e]
+    for enrollment in enrollments:
+        _transaction(lambda s, e=enrollment: _replay(s, e))
+    if enrollments:
+        print(f"✅ Replayed legacy payments into the fine ledger for {len(enrollments)} students")
+    return len(enrollments)
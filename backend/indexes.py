@@ -0,0 +1,223 @@
+# indexes.py
+# Every index the routes rely on, in one place.
+#
+#   ensure_indexes()            → create anything missing (idempotent, runs at startup)
+#   python indexes.py apply     → same, from a deploy step
+#   python indexes.py report    → missing indexes + indexes with no use in $indexStats
+#
+# Unique indexes are declared where the code already assumes one document per
+# key (upserts / duplicate checks). They are partial on the key existing, so
+# legacy documents without the field don't collide.
+import os
+import sys
+
+from pymongo import ASCENDING as ASC, DESCENDING as DESC, IndexModel
+
+from db import get_db
+
+NOTIFICATION_RETENTION_DAYS = int(os.getenv("NOTIFICATION_RETENTION_DAYS", 90))
+FINE_BATCH_RETENTION_DAYS = int(os.getenv("FINE_BATCH_RETENTION_DAYS", 7))
+
+
+def unique_on(*fields):
+    return {
+        "unique": True,
+        "partialFilterExpression": {f: {"$exists": True} for f in fields},
+    }
+
+
+# (database handle, collection) -> [IndexModel]
+INDEXES = {
+    # ---------------- college_db ----------------
+    ("college_db", "students"): [
+        IndexModel([("enrollment", ASC)]),
+        IndexModel([("branch", ASC)]),
+        IndexModel([("class_assigned", ASC)]),
+        IndexModel([("classname", ASC)]),
+        IndexModel([("branch_norm", ASC), ("class_norm", ASC)]),
+        IndexModel([("classname_norm", ASC)]),
+    ],
+    ("college_db", "student"): [
+        # attendance roster: batched {enrollment: {$in}} lookup in /mark, /class
+        IndexModel([("enrollment", ASC)]),
+        IndexModel([("class", ASC)]),
+    ],
+    ("college_db", "classes"): [
+        IndexModel([("classname", ASC)]),
+    ],
+    ("college_db", "attendance"): [
+        IndexModel([("enrollment", ASC), ("date", ASC), ("lectureId", ASC)],
+                   **unique_on("enrollment", "date", "lectureId")),
+        IndexModel([("branch_norm", ASC), ("section", ASC), ("date", ASC)]),
+    ],
+    ("college_db", "attendance_override"): [
+        IndexModel([("enrollment", ASC)], **unique_on("enrollment")),
+    ],
+    ("college_db", "attendance_stats"): [
+        IndexModel([("enrollment", ASC)], unique=True),
+    ],
+    ("college_db", "attendance_bitmaps"): [
+        IndexModel([("class", ASC), ("date", ASC), ("lectureId", ASC)], unique=True),
+    ],
+    ("college_db", "attendance_pdfs"): [
+        IndexModel([("year", ASC), ("branch", ASC), ("subject", ASC), ("week", ASC)],
+                   **unique_on("year", "branch", "subject", "week")),
+    ],
+    ("college_db", "fine"): [
+        IndexModel([("enrollment", ASC)]),
+        IndexModel([("fineKey", ASC)], **unique_on("fineKey")),
+        IndexModel([("enrollment", ASC), ("status", ASC), ("createdAt", ASC)]),
+    ],
+    ("college_db", "fine_batches"): [
+        IndexModel([("createdAt", ASC)], expireAfterSeconds=FINE_BATCH_RETENTION_DAYS * 86400),
+    ],
+    ("college_db", "payment_transactions"): [
+        IndexModel([("enrollment", ASC)]),
+        IndexModel([("razorpay_payment_id", ASC)], **unique_on("razorpay_payment_id")),
+    ],
+    ("college_db", "fine_balances"): [
+        IndexModel([("enrollment", ASC)], unique=True),
+    ],
+    ("college_db", "fcm_tokens"): [
+        IndexModel([("enrollment", ASC)], **unique_on("enrollment")),
+        IndexModel([("studentClass", ASC), ("lastSuccessAt", DESC)]),
+        IndexModel([("token", ASC)]),
+    ],
+    ("college_db", "webpush_subscriptions"): [
+        IndexModel([("enrollment", ASC)], unique=True),
+    ],
+    ("college_db", "notifications"): [
+        IndexModel([("target_type", ASC), ("target", ASC), ("timestamp", DESC), ("_id", DESC)]),
+        IndexModel([("timestamp", ASC)], expireAfterSeconds=NOTIFICATION_RETENTION_DAYS * 86400),
+    ],
+    ("college_db", "notification_reads"): [
+        IndexModel([("enrollment", ASC)], unique=True),
+    ],
+    ("college_db", "forms"): [
+        IndexModel([("active", ASC), ("created_at", DESC)]),
+    ],
+    ("college_db", "form_submissions"): [
+        IndexModel([("form_id", ASC), ("submitted_at", DESC)]),
+        IndexModel([("enrollment", ASC), ("submitted_at", DESC)]),
+    ],
+    ("college_db", "notes"): [
+        IndexModel([("noteId", ASC)], **unique_on("noteId")),
+        IndexModel([("class", ASC)]),
+    ],
+    ("college_db", "exams"): [
+        IndexModel([("examId", ASC)], **unique_on("examId")),
+        IndexModel([("class", ASC)]),
+    ],
+    ("college_db", "events"): [
+        IndexModel([("eventId", ASC)], **unique_on("eventId")),
+    ],
+    ("college_db", "assignments"): [
+        IndexModel([("assignmentId", ASC)], **unique_on("assignmentId")),
+        IndexModel([("class", ASC), ("active", ASC)]),
+        IndexModel([("class_normalized", ASC), ("active", ASC)]),
+        IndexModel([("active", ASC)]),
+    ],
+    ("college_db", "notices"): [
+        IndexModel([("title", ASC)]),
+        IndexModel([("target", ASC)]),
+        IndexModel([("targetClass", ASC)]),
+    ],
+    ("college_db", "timetables"): [
+        IndexModel([("timetableId", ASC)], **unique_on("timetableId")),
+        IndexModel([("class_norm", ASC)]),
+    ],
+    ("college_db", "mentors"): [
+        IndexModel([("mentorId", ASC)], **unique_on("mentorId")),
+        IndexModel([("email", ASC)], **unique_on("email")),
+    ],
+    ("college_db", "salary"): [
+        IndexModel([("mentorId", ASC)], **unique_on("mentorId")),
+    ],
+    ("college_db", "upload_jobs"): [
+        IndexModel([("status", ASC), ("updatedAt", ASC)]),
+    ],
+    ("college_db", "marks"): [
+        IndexModel([("enrollment", ASC)], unique=True),
+        IndexModel([("class", ASC)]),
+    ],
+
+    # ---------------- users ----------------
+    ("users", "students"): [
+        IndexModel([("enrollment", ASC)], **unique_on("enrollment")),
+        IndexModel([("branch", ASC)]),
+    ],
+    ("users", "fees"): [
+        IndexModel([("enrollment", ASC)]),
+    ],
+    ("users", "fines"): [
+        IndexModel([("enrollment", ASC)]),
+    ],
+}
+
+
+def _collection(handle, name):
+    return get_db(handle)[name]
+
+
+def ensure_indexes(verbose=False):
+    """
+    Create every registered index that doesn't exist yet.
+    One bad index (e.g. duplicates blocking a unique one) doesn't stop the rest.
+    Returns [(collection, index name, error)] for failures.
+    """
+    failures = []
+    for (handle, name), models in INDEXES.items():
+        coll = _collection(handle, name)
+        for model in models:
+            index_name = model.document["name"]
+            try:
+                coll.create_indexes([model])
+                if verbose:
+                    print(f"✅ {handle}.{name}: {index_name}")
+            except Exception as e:
+                failures.append((f"{handle}.{name}", index_name, str(e)))
+                print(f"⚠️ Index {handle}.{name}.{index_name} not created:", e)
+    return failures
+
+
+def report():
+    """Registered-but-missing indexes and existing indexes never used since restart"""
+    missing = []
+    unused = []
+    for (handle, name), models in INDEXES.items():
+        coll = _collection(handle, name)
+        existing = coll.index_information()
+
+        for model in models:
+            if model.document["name"] not in existing:
+                missing.append(f"{handle}.{name}.{model.document['name']}")
+
+        try:
+            for stat in coll.aggregate([{"$indexStats": {}}]):
+                if stat["name"] != "_id_" and stat["accesses"]["ops"] == 0:
+                    unused.append(f"{handle}.{name}.{stat['name']} (since {stat['accesses']['since']})")
+        except Exception as e:
+            print(f"⚠️ $indexStats unavailable for {handle}.{name}:", e)
+
+    return {"missing": missing, "unused": unused}
+
+
+if __name__ == "__main__":
+    command = sys.argv[1] if len(sys.argv) > 1 else "apply"
+
+    if command == "apply":
+        failed = ensure_indexes(verbose=True)
+        sys.exit(1 if failed else 0)
+
+    elif command == "report":
+        result = report()
+        print("❌ Missing indexes:")
+        for i in result["missing"] or ["(none)"]:
+            print("  ", i)
+        print("💤 Unused indexes:")
+        for i in result["unused"] or ["(none)"]:
+            print("  ", i)
+
+    else:
+        print("Usage: python indexes.py [apply|report]")
+        sys.exit(2)
@@ -1,9 +1,9 @@
 # models/uniform_request.py
 from datetime import datetime
-from pymongo import MongoClient
+from bson import ObjectId
+from db import get_db
 
-client = MongoClient("mongodb://localhost:27017")
-db = client["schoolDB"]
+db = get_db("school")
 
 uniform_requests = db["uniform_requests"]
 
@@ -15,6 +15,10 @@ def create_uniform_request(data):
 def get_all_requests():
     return list(uniform_requests.find())
 
+def iter_requests():
+    """Cursor version of get_all_requests (for streaming)"""
+    return uniform_requests.find()
+
 def update_status(request_id, new_status):
     return uniform_requests.update_one(
         {"_id": ObjectId(request_id)},
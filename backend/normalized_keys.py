@@ -0,0 +1,87 @@
+# normalized_keys.py
+# Canonical *_norm keys for case/format-insensitive lookups.
+#
+# Roster and class lookups used $regex with $options "i", which can't use an
+# index. Instead every write stores norm_key(value) next to the original and
+# reads do an exact match on the normalized field. App startup fills in the
+# key on documents that don't have one yet (backfill_all(only_missing=True));
+# `python normalized_keys.py` re-normalizes everything.
+from pymongo import UpdateOne
+
+from db import db, long_operation
+from utils import norm_key
+
+# collection -> {source field: normalized field}
+NORMALIZED_FIELDS = {
+    "students": {
+        "branch": "branch_norm",
+        "class_assigned": "class_norm",
+        "classname": "classname_norm",
+    },
+    "assignments": {
+        "class": "class_normalized",
+    },
+    "timetables": {
+        "class": "class_norm",
+    },
+    "attendance": {
+        "branch": "branch_norm",
+    },
+}
+
+
+def norm_fields(collection, doc):
+    """{normalized field: value} for the source fields present in `doc`"""
+    return {
+        target: norm_key(doc[source])
+        for source, target in NORMALIZED_FIELDS[collection].items()
+        if source in doc
+    }
+
+
+def backfill(collection, batch_size=1000, only_missing=False):
+    """
+    Store normalized keys → number of documents updated.
+    only_missing: just documents with a source field but no key (cheap
+    enough for every startup once the collection is done)
+    """
+    mapping = NORMALIZED_FIELDS[collection]
+    projection = {source: 1 for source in mapping}
+    projection.update({target: 1 for target in mapping.values()})
+
+    query = {}
+    if only_missing:
+        query = {"$or": [
+            {source: {"$exists": True}, target: {"$exists": False}}
+            for source, target in mapping.items()
+        ]}
+
+    ops = []
+    updated = 0
+    for doc in db[collection].find(query, projection):
+        changes = {
+            target: value
+            for target, value in norm_fields(collection, doc).items()
+            if doc.get(target) != value
+        }
+        if changes:
+            ops.append(UpdateOne({"_id": doc["_id"]}, {"$set": changes}))
+        if len(ops) >= batch_size:
+            db[collection].bulk_write(ops, ordered=False)
+            updated += len(ops)
+            ops = []
+
+    if ops:
+        db[collection].bulk_write(ops, ordered=False)
+        updated += len(ops)
+    return updated
+
+
+def backfill_all(only_missing=False):
+    with long_operation():
+        return {name: backfill(name, only_missing=only_missing) for name in NORMALIZED_FIELDS}
+
+
+if __name__ == "__main__":
+    for name, count in backfill_all().items():
+        print(f"✅ {name}: {count} documents normalized")
@@ -1,3 +1,4 @@
+import os
 from flask import Blueprint, request, jsonify, redirect
 from db import db
 from utils import generate_id
@@ -5,10 +6,17 @@ import cloudinary
 import cloudinary.uploader
 from flask_cors import cross_origin
 from datetime import datetime 
+from cache import cached, invalidate
+from versions import conditional
+from streaming import stream_json
+from pagination import Page, PageError, page_args
+import uploads
+import assets
 
 notes_bp = Blueprint("notes_bp", __name__, url_prefix="/api/notes")
 
 ALLOWED = {"pdf"}
+MAX_NOTE_MB = int(os.getenv("MAX_NOTE_MB", 30))
 
 def allowed_file(name):
     return "." in name and name.rsplit(".", 1)[1].lower() in ALLOWED
@@ -17,6 +25,7 @@ def allowed_file(name):
 # ----------------- UPLOAD NOTE -----------------
 @notes_bp.route("", methods=["POST", "OPTIONS"])
 @cross_origin()
+@uploads.max_upload(MAX_NOTE_MB)
 def upload_note():
     if request.method == "OPTIONS":
         return jsonify({}), 200
@@ -36,21 +45,6 @@ def upload_note():
     note_id = generate_id("N")
     safe_filename = file.filename
 
-    try:
-        # ---------- IMPORTANT RAW UPLOAD ----------
-        upload_result = cloudinary.uploader.upload(
-            file,
-            resource_type="raw",          # <--- MUST FOR PDF
-            folder="notes",               # folder in cloudinary
-            public_id=f"note_{note_id}",  # unique id
-            overwrite=True
-        )
-        # ------------------------------------------
-        file_url = upload_result.get("secure_url")
-
-    except Exception as e:
-        return jsonify({"success": False, "message": f"Cloudinary upload error: {str(e)}"}), 500
-
     rec = {
         "noteId": note_id,
         "title": title,
@@ -58,27 +52,55 @@ def upload_note():
         "deadline": deadline,
         "class": class_name,
         "originalFilename": safe_filename,
-        "file_url": file_url,
+        "file_url": None,
         "uploadedAt": datetime.utcnow().isoformat()
     }
-
     db.notes.insert_one(rec)
 
-    return jsonify({"success": True, "noteId": note_id, "file_url": file_url}), 201
+    try:
+        # ---------- IMPORTANT RAW UPLOAD (background) ----------
+        job_id = uploads.submit(
+            file,
+            {
+                "resource_type": "raw",          # <--- MUST FOR PDF
+                "folder": "notes",               # folder in cloudinary
+                "public_id": f"note_{note_id}",  # unique id
+                "overwrite": True
+            },
+            target=uploads.target("notes", {"noteId": note_id}, file_url="secure_url", assetId="asset_id"),
+            dedup=True
+        )
+        # --------------------------------------------------------
+    except Exception as e:
+        db.notes.delete_one({"noteId": note_id})
+        return jsonify({"success": False, "message": f"Upload error: {str(e)}"}), 500
+
+    invalidate("notes")
+
+    return jsonify({"success": True, "noteId": note_id, "jobId": job_id, "file_url": None}), 202
 
 
 
 # ----------------- GET ALL NOTES -----------------
 @notes_bp.route("", methods=["GET"])
 @cross_origin()
+@conditional("notes")
+@cached("notes")
 def list_all():
-    docs = list(db.notes.find({}, {"_id": 0}))
-    return jsonify({"success": True, "notes": docs})
+    try:
+        args = page_args(request.args)
+    except PageError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    page = Page(db.notes, {}, {"_id": 0}, args)
+    return stream_json(page, "notes", tail=lambda: {"next_cursor": page.next_cursor})
 
 
 # ----------------- GET NOTES BY CLASS -----------------
 @notes_bp.route("/class/<className>", methods=["GET"])
 @cross_origin()
+@conditional("notes")
+@cached("notes")
 def class_notes(className):
     className = className.replace(" ", "").upper()
     docs = list(db.notes.find({"class": className}, {"_id": 0}))
@@ -123,17 +145,20 @@ def direct_url(noteId):
 @notes_bp.route("/<noteId>", methods=["DELETE"])
 @cross_origin()
 def delete_note(noteId):
-    rec = db.notes.find_one({"noteId": noteId})
+    # delete first: an upload still pending for this note finds no record
+    # when it lands and releases its file itself
+    rec = db.notes.find_one_and_delete({"noteId": noteId})
     if not rec:
         return jsonify({"success": False, "message": "Not found"}), 404
-
-    public_id = f"notes/note_{noteId}"
+    invalidate("notes")
 
     try:
-        cloudinary.uploader.destroy(public_id, resource_type="raw", invalidate=True)
+        if rec.get("assetId"):
+            assets.release(rec["assetId"])     # destroyed with the last reference
+        elif "uploadStatus" not in rec:
+            # legacy note uploaded straight to Cloudinary
+            cloudinary.uploader.destroy(f"notes/note_{noteId}", resource_type="raw", invalidate=True)
     except Exception as e:
         return jsonify({"success": False, "message": f"Cloudinary delete error: {str(e)}"}), 500
 
-    db.notes.delete_one({"noteId": noteId})
-
     return jsonify({"success": True})
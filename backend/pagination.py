@@ -0,0 +1,111 @@
+# pagination.py
+# Keyset pagination + field projection for collection listings.
+#
+#   ?limit=50             page size (capped at MAX_LIMIT)
+#   ?cursor=<token>       opaque token from the previous page's next_cursor
+#   ?fields=title,class   only return these fields
+#
+# Pages are ordered by _id and continue with {_id: {$gt: last}}, so every page
+# is a bounded range scan on the _id index no matter how deep you go.
+# Without ?limit / ?cursor a listing returns everything, like before.
+import base64
+import re
+
+from bson import ObjectId
+
+MAX_LIMIT = 500
+FIELD_RE = re.compile(r"^[A-Za-z0-9_.]+$")
+HIDDEN_FIELDS = {"password"}
+
+
+class PageError(ValueError):
+    pass
+
+
+def encode_cursor(oid):
+    return base64.urlsafe_b64encode(str(oid).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)).decode()
+        return ObjectId(raw)
+    except Exception:
+        raise PageError("Invalid cursor")
+
+
+def page_args(args, allowed_fields=None, max_limit=MAX_LIMIT):
+    """Parse limit / cursor / fields from request.args"""
+    limit = args.get("limit")
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise PageError("limit must be a number")
+        if limit <= 0:
+            raise PageError("limit must be positive")
+        limit = min(limit, max_limit)
+
+    after = decode_cursor(args["cursor"]) if args.get("cursor") else None
+    if after is not None and limit is None:
+        limit = max_limit
+
+    fields = None
+    if args.get("fields"):
+        fields = [f.strip() for f in args["fields"].split(",") if f.strip()]
+        for f in fields:
+            if not FIELD_RE.match(f) or f in HIDDEN_FIELDS:
+                raise PageError(f"Invalid field: {f}")
+            if allowed_fields is not None and f not in allowed_fields:
+                raise PageError(f"Field not available: {f}")
+
+    return {"limit": limit, "after": after, "fields": fields}
+
+
+class Page:
+    """
+    Iterable page of documents. After iterating, .next_cursor is the token for
+    the following page (None on the last one).
+    """
+
+    def __init__(self, collection, query, projection, args):
+        projection = dict(projection or {})
+        self.hide_id = projection.get("_id") == 0
+
+        if args["fields"]:
+            projection = {f: 1 for f in args["fields"]}
+        projection.pop("_id", None)
+        if any(projection.values()):
+            projection["_id"] = 1     # inclusion projection — keyset still needs _id
+
+        if args["after"] is not None:
+            query = {"$and": [query or {}, {"_id": {"$gt": args["after"]}}]}
+
+        cursor = collection.find(query, projection or None)
+        if args["limit"] or args["after"] is not None:
+            cursor = cursor.sort("_id", 1)
+        if args["limit"]:
+            cursor = cursor.limit(args["limit"])
+
+        self.cursor = cursor
+        self.limit = args["limit"]
+        self.count = 0
+        self.last_id = None
+
+    def batch_size(self, n):
+        self.cursor = self.cursor.batch_size(n)
+        return self
+
+    def __iter__(self):
+        for doc in self.cursor:
+            self.count += 1
+            self.last_id = doc.get("_id")
+            if self.hide_id:
+                doc.pop("_id", None)
+            yield doc
+
+    @property
+    def next_cursor(self):
+        if self.limit and self.count >= self.limit and self.last_id is not None:
+            return encode_cursor(self.last_id)
+        return None
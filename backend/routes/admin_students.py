@@ -1,8 +1,10 @@
-from flask import Blueprint, jsonify
-from pymongo import MongoClient
-import os
+from flask import Blueprint, jsonify, request
+from db import get_db
+from bson import ObjectId
 import re
 
+from attendance_stats import get_summaries
+
 admin_students_bp = Blueprint(
     "admin_students_bp",
     __name__,
@@ -11,17 +13,18 @@ admin_students_bp = Blueprint(
 
 # -------------------- Mongo Connections --------------------
 
-users_client = MongoClient(os.getenv("MONGO_URL"))
-users_db = users_client["users"]
+users_db = get_db("users")
 
 students_collection = users_db["students"]
 fees_collection = users_db["fees"]
 fines_collection = users_db["fines"]
 
-college_client = MongoClient(os.getenv("MONGO_COLLEGE_DB_URI"))
-college_db = college_client["college_db"]
+college_db = get_db("college_db")
 attendance_collection = college_db["attendance"]
 
+CHUNK = 1000      # students resolved per set-based round
+MAX_PAGE = 5000   # hard cap when ?limit= is used
+
 # -------------------- Helpers --------------------
 
 def extract_year(class_name: str):
@@ -36,75 +39,90 @@ def extract_year(class_name: str):
     return m.group(1) if m else "—"
 
 
-def attendance_summary(enrollment):
-    total = attendance_collection.count_documents(
-        {"enrollment": enrollment}
-    )
-    present = attendance_collection.count_documents(
-        {"enrollment": enrollment, "status": "P"}
-    )
-
-    percentage = round((present / total) * 100, 2) if total else 0
-
+def fines_by_enrollment(enrollments):
+    """Total fine per student — one $group for the whole page"""
     return {
-        "total": total,
-        "present": present,
-        "percentage": percentage
+        row["_id"]: row["fine"]
+        for row in fines_collection.aggregate([
+            {"$match": {"enrollment": {"$in": enrollments}}},
+            {"$group": {"_id": "$enrollment", "fine": {"$sum": "$fine"}}}
+        ])
     }
 
 
-def total_fine(enrollment):
-    fines = fines_collection.find(
-        {"enrollment": enrollment},
-        {"fine": 1}
-    )
-    return sum(f.get("fine", 0) for f in fines)
-
-
-# -------------------- API --------------------
+def fees_by_enrollment(enrollments):
+    return {
+        f["enrollment"]: f.get("pending_fees", 0)
+        for f in fees_collection.find(
+            {"enrollment": {"$in": enrollments}},
+            {"_id": 0, "enrollment": 1, "pending_fees": 1}
+        )
+    }
 
-@admin_students_bp.route("", methods=["GET"])
-def get_all_students():
-    try:
-        students = list(students_collection.find({}, {"_id": 0}))
-        final_students = []
 
-        for s in students:
-            enrollment = s.get("enrollment")
+def build_query(args):
+    """Server-side filters: ?branch=IT&year=2&cursor=<last _id>"""
+    query = {}
 
-            # ✅ Pending Fees (DON'T TOUCH)
-            fees_doc = fees_collection.find_one(
-                {"enrollment": enrollment},
-                {"_id": 0, "pending_fees": 1}
-            )
+    branch = args.get("branch")
+    if branch:
+        query["branch"] = branch
 
-            final_students.append({
-                "name": s.get("name"),
-                "enrollment": enrollment,
+    year = args.get("year")
+    if year:
+        query["class"] = {"$regex": f"^{re.escape(year)}(st|nd|rd|th)\\s*Year"}
 
-                # ✅ Branch fix
-                "branch": s.get("branch"),
+    cursor = args.get("cursor")
+    if cursor:
+        if not ObjectId.is_valid(cursor):
+            raise ValueError("Invalid cursor")
+        query["_id"] = {"$gt": ObjectId(cursor)}
 
-                # ❌ Section hata diya (as per your rule)
-                "section": "—",
+    return query
 
-                # ✅ Proper year from class
-                "year": extract_year(s.get("class")),
 
-                # ✅ FULL attendance object
-                "attendance": attendance_summary(enrollment),
+# -------------------- API --------------------
 
-                # ✅ Fees unchanged
-                "pendingFees": fees_doc.get("pending_fees", 0) if fees_doc else 0,
+@admin_students_bp.route("", methods=["GET"])
+def get_all_students():
+    try:
+        try:
+            query = build_query(request.args)
+            limit = int(request.args.get("limit", 0))
+        except ValueError as e:
+            return jsonify({"success": False, "message": str(e)}), 400
+
+        cursor = students_collection.find(
+            query,
+            {"_id": 1, "name": 1, "enrollment": 1, "branch": 1, "class": 1}
+        ).sort("_id", 1)
+        if limit > 0:
+            cursor = cursor.limit(min(limit, MAX_PAGE))
 
-                # ✅ TOTAL fine (FIXED)
-                "fine": total_fine(enrollment)
-            })
+        final_students = []
+        last_id = None
+
+        # 🔹 process in chunks → 3 set-based queries per chunk, not 4 per student
+        batch = []
+        for s in cursor:
+            batch.append(s)
+            if len(batch) >= CHUNK:
+                final_students.extend(build_rows(batch))
+                last_id = batch[-1]["_id"]
+                batch = []
+        if batch:
+            final_students.extend(build_rows(batch))
+            last_id = batch[-1]["_id"]
+
+        next_cursor = None
+        if limit > 0 and len(final_students) >= min(limit, MAX_PAGE):
+            next_cursor = str(last_id)
 
         return jsonify({
             "success": True,
             "count": len(final_students),
-            "students": final_students
+            "students": final_students,
+            "next_cursor": next_cursor
         }), 200
 
     except Exception as e:
@@ -113,3 +131,45 @@ def get_all_students():
             "success": False,
             "message": "Internal server error"
         }), 500
+
+
+def build_rows(students):
+    enrollments = [s.get("enrollment") for s in students]
+
+    attendance = get_summaries(enrollments)
+    fees = fees_by_enrollment(enrollments)
+    fines = fines_by_enrollment(enrollments)
+
+    rows = []
+    for s in students:
+        enrollment = s.get("enrollment")
+        summary = attendance.get(enrollment, {})
+
+        rows.append({
+            "name": s.get("name"),
+            "enrollment": enrollment,
+
+            # ✅ Branch fix
+            "branch": s.get("branch"),
+
+            # ❌ Section hata diya (as per your rule)
+            "section": "—",
+
+            # ✅ Proper year from class
+            "year": extract_year(s.get("class")),
+
+            # ✅ FULL attendance object
+            "attendance": {
+                "total": summary.get("total", 0),
+                "present": summary.get("present", 0),
+                "percentage": summary.get("percentage", 0)
+            },
+
+            # ✅ Fees unchanged
+            "pendingFees": fees.get(enrollment, 0),
+
+            # ✅ TOTAL fine (FIXED)
+            "fine": fines.get(enrollment, 0)
+        })
+
+    return rows
@@ -1,10 +1,12 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import CORS
-from pymongo import MongoClient
-import os
+from db import get_db
 import re
 from datetime import datetime
-from utils import generate_id
+from utils import generate_id, norm_key
+from cache import cached, invalidate
+from versions import conditional
+from streaming import stream_json
 from routes.notifications import send_notification_to_class
 
 assignments_bp = Blueprint(
@@ -17,20 +19,14 @@ CORS(assignments_bp)
 # -----------------------------
 # MongoDB Setup
 # -----------------------------
-MONGO_URI = os.getenv("MONGO_COLLEGE_DB_URI", "mongodb://localhost:27017/")
-client = MongoClient(MONGO_URI)
-db = client["college_db"]
+db = get_db("college_db")
 assignments_collection = db["assignments"]
 
 # -----------------------------
 # Normalize class format
 # -----------------------------
 def normalize_class_name(class_name):
-    if not class_name:
-        return ""
-    class_name = class_name.strip().upper()
-    class_name = re.sub(r"[^A-Z0-9]", "", class_name)
-    return class_name
+    return norm_key(class_name)
 
 # -----------------------------
 # Convert admin class → student format
@@ -63,27 +59,32 @@ def to_student_class_format(raw_class):
 # GET all ACTIVE assignments
 # -----------------------------
 @assignments_bp.route("", methods=["GET"])
+@conditional("assignments")
+@cached("assignments")
 def get_all_assignments():
-    assignments = list(
-        assignments_collection.find(
-            {"active": True},
-            {"_id": 0}
-        )
+    cursor = assignments_collection.find(
+        {"active": True},
+        {"_id": 0}
     )
-    return jsonify({
-        "success": True,
-        "assignments": assignments
-    }), 200
+    return stream_json(cursor, "assignments")
 
 # -----------------------------
 # GET ACTIVE assignments by class
 # -----------------------------
 @assignments_bp.route("/class/<class_name>", methods=["GET"])
+@conditional("assignments")
+@cached("assignments")
 def get_assignments_by_class(class_name):
+    # prefix match, so "IT" still finds "IT-A" and "IT-B"; anchored, it stays
+    # an index range scan on class_normalized
+    prefix = normalize_class_name(class_name)
+    if not prefix:
+        return jsonify({"success": True, "assignments": []}), 200
+
     assignments = list(
         assignments_collection.find(
             {
-                "class": {"$regex": class_name, "$options": "i"},
+                "class_normalized": {"$regex": f"^{re.escape(prefix)}"},
                 "active": True
             },
             {"_id": 0}
@@ -128,6 +129,7 @@ def post_assignment():
         }
 
         assignments_collection.insert_one(assignment)
+        invalidate("assignments")
 
         # 🔔 SEND CLASS-WISE NOTIFICATION
         send_notification_to_class(
@@ -165,6 +167,7 @@ def delete_assignment(assignmentId):
             "message": "Assignment not found"
         }), 404
 
+    invalidate("assignments")
     return jsonify({
         "success": True,
         "message": "Assignment deleted & reminders stopped"
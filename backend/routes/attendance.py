@@ -1,18 +1,25 @@
 from flask import Blueprint, request, jsonify
 from datetime import datetime
-from pymongo import MongoClient
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import BulkWriteError
 from flask_cors import CORS, cross_origin
-import os
+from db import get_db
+from streaming import stream_json
+from pagination import Page, PageError, page_args
+from auth.middleware import admin_required
+from utils import norm_key
 
 # 🔔 Import notifications helper
 from routes.notifications import send_to_enrollment
+from attendance_stats import stats_update, apply_changes, get_summary, rebuild
+from attendance_analytics import class_report, invalidate_reports, DEFAULT_THRESHOLD
+import attendance_bitmaps
 
 attendance_bp = Blueprint('attendance', __name__, url_prefix='/api/attendance')
 CORS(attendance_bp, resources={r"/*": {"origins": "*"}})
 
 # MongoDB
-client = MongoClient(os.getenv("MONGO_COLLEGE_DB_URI"))
-db = client["college_db"]
+db = get_db("college_db")
 
 students_collection = db["student"]
 attendance_collection = db["attendance"]
@@ -30,6 +37,17 @@ def get_students_by_class_get(class_name):
     return jsonify({"success": True, "count": len(students), "students": students}), 200
 
 
+def _bulk_write(ops, keys):
+    """Unordered bulk write → (upserted op indexes, {key: error} for failed ops)"""
+    try:
+        return attendance_collection.bulk_write(ops, ordered=False).upserted_ids, {}
+    except BulkWriteError as e:
+        print("❌ Attendance bulk write error:", e.details)
+        upserted = {u["index"] for u in e.details.get("upserted", [])}
+        failed = {keys[err["index"]]: err.get("errmsg") for err in e.details.get("writeErrors", [])}
+        return upserted, failed
+
+
 # ------------------------------------------------
 # 2️⃣ Mark Attendance (P / A) — REAL ATTENDANCE
 # ------------------------------------------------
@@ -44,37 +62,118 @@ def mark_attendance():
             return jsonify({"success": False, "message": "Invalid payload"}), 400
 
         today = datetime.utcnow().strftime("%Y-%m-%d")
-        saved = 0
+        now = datetime.utcnow()
 
+        # 🔹 normalize payload → {enrollment: status}, bad statuses skipped
+        results = {}
+        marks = {}
         for enrollment, status in records.items():
-            enrollment = enrollment.strip().upper()
+            enrollment = str(enrollment).strip().upper()
             if status not in ("P", "A"):
+                results[enrollment] = "skipped"
                 continue
-
-            student = students_collection.find_one({"enrollment": enrollment})
+            marks[enrollment] = status
+
+        # 🔹 ONE lookup for the whole class
+        students = {
+            s["enrollment"]: s
+            for s in students_collection.find(
+                {"enrollment": {"$in": list(marks)}},
+                {"_id": 0, "enrollment": 1, "year": 1, "branch": 1, "section": 1}
+            )
+        } if marks else {}
+
+        # 🔹 ONE unordered bulk upsert — only creates missing records, so
+        #    upserted_ids says exactly which marks are new
+        ops = []
+        order = []
+        fields = {}
+        for enrollment, status in marks.items():
+            student = students.get(enrollment)
             if not student:
+                results[enrollment] = "unknown"
                 continue
 
-            attendance_collection.update_one(
-                {
-                    "enrollment": enrollment,
-                    "date": today,
-                    "lectureId": lecture_id
-                },
-                {
-                    "$set": {
-                        "status": status,
-                        "year": student.get("year"),
-                        "branch": student.get("branch"),
-                        "section": student.get("section"),
-                        "markedAt": datetime.utcnow()
-                    }
-                },
+            fields[enrollment] = {
+                "status": status,
+                "year": student.get("year"),
+                "branch": student.get("branch"),
+                "branch_norm": norm_key(student.get("branch")),
+                "section": student.get("section"),
+                "markedAt": now
+            }
+            ops.append(UpdateOne(
+                {"enrollment": enrollment, "date": today, "lectureId": lecture_id},
+                {"$setOnInsert": fields[enrollment]},
                 upsert=True
+            ))
+            order.append(enrollment)
+            results[enrollment] = "saved"
+
+        failed = {}
+        if ops:
+            upserted, failed = _bulk_write(ops, order)
+            inserted = {order[i] for i in upserted}
+            results.update({e: "failed" for e in failed})
+            order = [e for e in order if e not in failed]
+
+            # 🔹 re-marks: ONE read of the statuses they replace, ONE bulk
+            #    write for the ones that actually changed
+            remarked = [e for e in order if e not in inserted]
+            prior = {
+                d["enrollment"]: d.get("status")
+                for d in attendance_collection.find(
+                    {"enrollment": {"$in": remarked}, "date": today, "lectureId": lecture_id},
+                    {"_id": 0, "enrollment": 1, "status": 1}
+                )
+            } if remarked else {}
+
+            # 🔹 rollup deltas: new records count once, re-marks diff
+            #    against the status they replaced
+            stats_ops = []
+            changes = []
+            changed = []
+            for enrollment in order:
+                status = marks[enrollment]
+                if enrollment in inserted:
+                    stats_ops.append(stats_update(enrollment, today, lecture_id, 1, int(status == "P")))
+                    continue
+
+                existed = enrollment in prior
+                old = prior.get(enrollment)
+                if existed and old == status:
+                    continue
+                changes.append(UpdateOne(
+                    {"enrollment": enrollment, "date": today, "lectureId": lecture_id},
+                    {"$set": fields[enrollment]},
+                    upsert=True
+                ))
+                changed.append((enrollment, stats_update(
+                    enrollment, today, lecture_id,
+                    0 if existed else 1,
+                    (status == "P") - (old == "P")
+                )))
+
+            if changes:
+                _, not_changed = _bulk_write(changes, [e for e, _ in changed])
+                failed.update(not_changed)
+                results.update({e: "failed" for e in not_changed})
+                stats_ops += [op for e, op in changed if e not in not_changed]
+            apply_changes(stats_ops)
+            attendance_bitmaps.record_marks(
+                students,
+                {e: marks[e] for e, r in results.items() if r == "saved"},
+                today, lecture_id
             )
-            saved += 1
+            invalidate_reports()
+
+        saved = sum(1 for r in results.values() if r == "saved")
 
-        return jsonify({"success": True, "saved": saved}), 200
+        response = {"success": not failed, "saved": saved, "results": results}
+        if failed:
+            response["message"] = f"{len(failed)} record(s) not saved"
+            response["failed"] = sorted(failed)
+        return jsonify(response), 200
 
     except Exception as e:
         print("❌ Attendance error:", e)
@@ -104,21 +203,15 @@ def get_student_attendance(enrollment):
             }
         }), 200
 
-    # 🔁 fallback to real attendance
-    total = attendance_collection.count_documents({"enrollment": enrollment})
-    present = attendance_collection.count_documents({
-        "enrollment": enrollment,
-        "status": "P"
-    })
-
-    percentage = round((present / total) * 100, 2) if total else 0
+    # 🔁 fallback to real attendance (rollup)
+    summary = get_summary(enrollment)
 
     return jsonify({
         "success": True,
         "attendance": {
-            "total": total,
-            "present": present,
-            "percentage": percentage,
+            "total": summary["total"],
+            "present": summary["present"],
+            "percentage": summary["percentage"],
             "source": "auto"
         }
     }), 200
@@ -137,14 +230,24 @@ def edit_attendance():
     if not all([enrollment, date, new_status]):
         return jsonify({"success": False, "message": "Missing fields"}), 400
 
-    result = attendance_collection.update_one(
+    before = attendance_collection.find_one_and_update(
         {"enrollment": enrollment, "date": date},
-        {"$set": {"status": new_status}}
+        {"$set": {"status": new_status}},
+        return_document=ReturnDocument.BEFORE
     )
 
-    if result.matched_count == 0:
+    if before is None:
         return jsonify({"success": False, "message": "Record not found"}), 404
 
+    apply_changes([stats_update(
+        enrollment, date, before.get("lectureId"),
+        0, (new_status == "P") - (before.get("status") == "P")
+    )])
+    attendance_bitmaps.record_marks(
+        {enrollment: before}, {enrollment: new_status}, date, before.get("lectureId")
+    )
+    invalidate_reports()
+
     send_to_enrollment(
         enrollment,
         "📢 Attendance Updated",
@@ -185,6 +288,8 @@ def edit_attendance_percentage():
             upsert=True
         )
 
+        invalidate_reports()
+
         send_to_enrollment(
             enrollment,
             "📢 Attendance Percentage Updated",
@@ -223,13 +328,23 @@ def get_students_by_class():
 # ------------------------------------------------
 # 7️⃣ Get all students (attendance panel)
 # ------------------------------------------------
+STUDENT_LIST_FIELDS = {"enrollment", "name", "year", "branch", "section"}
+
+
 @attendance_bp.route("/students", methods=["GET"])
 def get_all_students_for_attendance():
-    students = list(students_collection.find(
+    try:
+        args = page_args(request.args, allowed_fields=STUDENT_LIST_FIELDS)
+    except PageError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+
+    page = Page(
+        students_collection,
         {},
-        {"_id": 0, "enrollment": 1, "name": 1, "year": 1, "branch": 1, "section": 1}
-    ))
-    return jsonify({"success": True, "count": len(students), "students": students}), 200
+        {"_id": 0, "enrollment": 1, "name": 1, "year": 1, "branch": 1, "section": 1},
+        args
+    )
+    return stream_json(page, "students", tail=lambda: {"next_cursor": page.next_cursor})
 # ----------------------------------------
 # 3️⃣ Attendance Summary — VIEW PAGE
 # ----------------------------------------
@@ -237,27 +352,85 @@ def get_all_students_for_attendance():
 def attendance_summary(enrollment):
     enrollment = enrollment.strip().upper()
 
-    records = list(attendance_collection.find(
-        {"enrollment": enrollment},
-        {"status": 1}
-    ))
+    summary = get_summary(enrollment)
 
-    if not records:
-        return jsonify({"success": True, "summary": {
-            "total": 0, "present": 0, "absent": 0, "percentage": 0
-        }})
+    return jsonify({"success": True, "summary": summary})
 
-    total = len(records)
-    present = sum(1 for r in records if r["status"] == "P")
-    absent = total - present
-    percentage = round((present / total) * 100, 2)
 
-    return jsonify({
-        "success": True,
-        "summary": {
-            "total": total,
-            "present": present,
-            "absent": absent,
-            "percentage": percentage
-        }
-    })
+# ----------------------------------------
+# 🔄 Rebuild attendance rollups (Admin)
+# ----------------------------------------
+@attendance_bp.route("/stats/rebuild", methods=["POST"])
+@admin_required
+def rebuild_attendance_stats():
+    try:
+        count = rebuild()
+        return jsonify({"success": True, "students": count}), 200
+    except Exception as e:
+        print("❌ Stats rebuild error:", e)
+        return jsonify({"success": False}), 500
+
+
+# ----------------------------------------
+# 📊 Class attendance report + defaulters (Admin)
+# ----------------------------------------
+@attendance_bp.route("/report", methods=["GET"])
+@admin_required
+def attendance_report():
+    branch = (request.args.get("branch") or "").strip()
+    if not branch:
+        return jsonify({"success": False, "message": "branch required"}), 400
+
+    try:
+        threshold = float(request.args.get("threshold", DEFAULT_THRESHOLD))
+    except ValueError:
+        return jsonify({"success": False, "message": "threshold must be a number"}), 400
+
+    try:
+        report = class_report(
+            branch,
+            section=request.args.get("section"),
+            year=request.args.get("year"),
+            start=request.args.get("from"),
+            end=request.args.get("to"),
+            lecture_id=request.args.get("lectureId"),
+            threshold=threshold
+        )
+        return jsonify({"success": True, "report": report}), 200
+    except Exception as e:
+        print("❌ Attendance report error:", e)
+        return jsonify({"success": False}), 500
+
+
+# ----------------------------------------
+# 🧮 Class summary from compact bitmaps (ATTENDANCE_BITMAPS=1)
+# ----------------------------------------
+@attendance_bp.route("/report/compact", methods=["GET"])
+@admin_required
+def attendance_compact_report():
+    branch = request.args.get("branch")
+    year = request.args.get("year")
+    section = request.args.get("section")
+    if not branch:
+        return jsonify({"success": False, "message": "branch required"}), 400
+
+    try:
+        threshold = float(request.args.get("threshold", DEFAULT_THRESHOLD))
+    except ValueError:
+        return jsonify({"success": False, "message": "threshold must be a number"}), 400
+
+    try:
+        summary = attendance_bitmaps.class_summary(
+            branch, year, section,
+            start=request.args.get("from"),
+            end=request.args.get("to"),
+            lecture_id=request.args.get("lectureId")
+        )
+        summary["defaulters"] = sorted(
+            ({"enrollment": e, **s} for e, s in summary["students"].items() if s["percentage"] < threshold),
+            key=lambda s: (s["percentage"], s["enrollment"])
+        )
+        return jsonify({"success": True, "report": summary}), 200
+    except Exception as e:
+        print("❌ Compact attendance report error:", e)
+        return jsonify({"success": False}), 500
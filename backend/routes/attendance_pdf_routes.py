@@ -1,3 +1,4 @@
+import os
 from flask import Blueprint, request, jsonify
 from werkzeug.utils import secure_filename
 from datetime import datetime
@@ -7,19 +8,32 @@ import cloudinary.uploader
 from db import db
 from auth.middleware import mentor_required, admin_required
 from bson import ObjectId
+from pymongo import ReturnDocument
+import uploads
+import assets
 
 
 attendance_pdf_bp = Blueprint("attendance_pdf_bp", __name__)
 
 ALLOWED = {"pdf"}
+MAX_ATTENDANCE_PDF_MB = int(os.getenv("MAX_ATTENDANCE_PDF_MB", 30))
 
 def allowed_file(filename):
     return "." in filename and filename.rsplit(".", 1)[1].lower() in ALLOWED
 
+
+def release_pdf(pdf):
+    """Let go of a record's file (shared assets survive until the last reference)"""
+    if pdf.get("assetId"):
+        assets.release(pdf["assetId"])
+    elif pdf.get("cloudinary_id"):
+        cloudinary.uploader.destroy(pdf["cloudinary_id"], resource_type="raw")
+
 # =========================
 # MENTOR → UPLOAD PDF
 # =========================
 @attendance_pdf_bp.route("/api/attendance-pdf/upload", methods=["POST"])
+@uploads.max_upload(MAX_ATTENDANCE_PDF_MB)
 def upload_attendance_pdf():
     try:
         year    = request.form.get("year")
@@ -37,43 +51,42 @@ def upload_attendance_pdf():
         # Generate unique filename
         filename = f"{year}_{branch}_{subject}_week{week}_{generate_id()}.pdf"
 
-        # Upload to Cloudinary
-        upload_result = cloudinary.uploader.upload(
-            file,
-            resource_type="raw",  # for PDFs
-            public_id=f"attendance_pdfs/{filename}",
-            overwrite=True
-        )
-
-        pdf_url = upload_result.get("secure_url")
-        public_id = upload_result.get("public_id")
-
-        if not pdf_url:
-            return jsonify({"success": False, "message": "Upload failed"}), 500
-
-        # Save info in MongoDB
+        # Save info in MongoDB (URL filled in by the upload job)
         query = {"year": year, "branch": branch, "subject": subject, "week": int(week)}
         data = {
             **query,
-            "pdfUrl": pdf_url,
             "filename": filename,
-            "cloudinary_id": public_id,
             "uploadedAt": datetime.utcnow(),
             "updated": False
         }
 
         # Upsert PDF record
-        db.attendance_pdfs.update_one(query, {"$set": data}, upsert=True)
+        saved_pdf = db.attendance_pdfs.find_one_and_update(
+            query, {"$set": data}, upsert=True, return_document=ReturnDocument.AFTER
+        )
 
-        # 🔹 Fetch the saved record to get _id
-        saved_pdf = db.attendance_pdfs.find_one(query)
+        # Upload to Cloudinary (background)
+        job_id = uploads.submit(
+            file,
+            {
+                "resource_type": "raw",  # for PDFs
+                "public_id": f"attendance_pdfs/{filename}",
+                "overwrite": True
+            },
+            target=uploads.target(
+                "attendance_pdfs", {"_id": saved_pdf["_id"]},
+                pdfUrl="secure_url", cloudinary_id="public_id", assetId="asset_id"
+            ),
+            dedup=True     # the job releases the file this one replaces
+        )
 
         return jsonify({
             "success": True,
-            "message": "Attendance PDF uploaded",
-            "pdfUrl": pdf_url,
-            "pdfId": str(saved_pdf["_id"])  # ✅ send _id to frontend
-        })
+            "message": "Attendance PDF upload queued",
+            "pdfUrl": saved_pdf.get("pdfUrl"),
+            "pdfId": str(saved_pdf["_id"]),  # ✅ send _id to frontend
+            "jobId": job_id
+        }), 202
 
     except Exception as e:
         print("Error uploading PDF:", e)
@@ -100,7 +113,9 @@ def view_attendance_pdfs():
             "branch": pdf["branch"],
             "subject": pdf["subject"],
             "week": pdf["week"],
-            "pdfUrl": pdf["pdfUrl"],
+            "pdfUrl": pdf.get("pdfUrl"),  # None until the upload job lands
+            "uploadStatus": pdf.get("uploadStatus", "done"),
+            "uploadError": pdf.get("uploadError"),
             "updated": pdf.get("updated", False),
         })
 
@@ -137,17 +152,13 @@ def delete_attendance_pdf(pdf_id):
         if not ObjectId.is_valid(pdf_id):
             return jsonify({"success": False, "message": "Invalid PDF ID"}), 400
 
-        pdf = db.attendance_pdfs.find_one({"_id": ObjectId(pdf_id)})
+        # Delete record first — a pending upload then releases its own file
+        pdf = db.attendance_pdfs.find_one_and_delete({"_id": ObjectId(pdf_id)})
         if not pdf:
             return jsonify({"success": False, "message": "PDF not found"}), 404
 
-        # Delete PDF from Cloudinary
-        cloud_id = pdf.get("cloudinary_id")
-        if cloud_id:
-            cloudinary.uploader.destroy(cloud_id, resource_type="raw")
-
-        # Delete record from MongoDB
-        db.attendance_pdfs.delete_one({"_id": ObjectId(pdf_id)})
+        # Delete PDF from Cloudinary (once nothing else uses it)
+        release_pdf(pdf)
 
         return jsonify({"success": True, "message": "PDF deleted successfully"})
 
@@ -158,6 +169,7 @@ def delete_attendance_pdf(pdf_id):
 # Update PDF
 # =========================
 @attendance_pdf_bp.route("/api/attendance-pdf/update/<pdf_id>", methods=["POST"])
+@uploads.max_upload(MAX_ATTENDANCE_PDF_MB)
 def update_attendance_pdf(pdf_id):
     try:
         if not ObjectId.is_valid(pdf_id):
@@ -172,35 +184,38 @@ def update_attendance_pdf(pdf_id):
         if not pdf:
             return jsonify({"success": False, "message": "PDF not found"}), 404
 
-        # Delete old file from Cloudinary
-        cloud_id = pdf.get("cloudinary_id")
-        if cloud_id:
-            cloudinary.uploader.destroy(cloud_id, resource_type="raw")
-
-        # Upload new file
+        # Reset updated status; URL is swapped in by the upload job
         filename = f"{pdf['year']}_{pdf['branch']}_{pdf['subject']}_week{pdf['week']}_{generate_id()}.pdf"
-        upload_result = cloudinary.uploader.upload(
-            file,
-            resource_type="raw",
-            public_id=f"attendance_pdfs/{filename}",
-            overwrite=True
-        )
-        pdf_url = upload_result.get("secure_url")
-        public_id = upload_result.get("public_id")
-
-        # Update MongoDB record & reset updated status
         db.attendance_pdfs.update_one(
             {"_id": ObjectId(pdf_id)},
             {"$set": {
-                "pdfUrl": pdf_url,
                 "filename": filename,
-                "cloudinary_id": public_id,
                 "updated": False,
                 "uploadedAt": datetime.utcnow()
             }}
         )
 
-        return jsonify({"success": True, "message": "PDF updated", "pdfUrl": pdf_url})
+        # Upload new file (background) — old one is destroyed once it's replaced
+        job_id = uploads.submit(
+            file,
+            {
+                "resource_type": "raw",
+                "public_id": f"attendance_pdfs/{filename}",
+                "overwrite": True
+            },
+            target=uploads.target(
+                "attendance_pdfs", {"_id": ObjectId(pdf_id)},
+                pdfUrl="secure_url", cloudinary_id="public_id", assetId="asset_id"
+            ),
+            dedup=True     # the job releases the file this one replaces
+        )
+
+        return jsonify({
+            "success": True,
+            "message": "PDF update queued",
+            "pdfUrl": pdf.get("pdfUrl"),
+            "jobId": job_id
+        }), 202
 
     except Exception as e:
         print("Error updating PDF:", e)
@@ -3,9 +3,7 @@ from flask_cors import cross_origin
 import cloudinary
 import cloudinary.uploader
 from db import db
-
-# 🔔 Notification helper
-from routes.notifications import notify_bus
+import uploads
 
 bus_bp = Blueprint("bus_bp", __name__, url_prefix="/api/bus")
 
@@ -30,31 +28,33 @@ def upload_bus_pdf():
         return jsonify({"success": False, "message": "File must be PDF"}), 400
 
     try:
-        upload_result = cloudinary.uploader.upload(
-            pdf,
-            folder="bus",
-            public_id="bus_routes",
-            resource_type="raw",
-            overwrite=True
-        )
+        # Make sure the single bus document exists, the job fills pdf_url
+        db.bus.update_one({}, {"$setOnInsert": {"pdf_url": None}}, upsert=True)
+        bus = db.bus.find_one({}, {"_id": 1, "pdf_url": 1})
 
-        pdf_url = upload_result.get("secure_url")
-
-        # Save inside database
-        db.bus.update_one({}, {"$set": {"pdf_url": pdf_url}}, upsert=True)
-
-        # 🔔 GLOBAL NOTIFICATION (ALL USERS)
-        notify_bus(
-            title="🚌 Bus Route Updated",
-            body="New bus route PDF has been uploaded. Check routes now.",
-            url="/bus-route.html"
+        job_id = uploads.submit(
+            pdf,
+            {
+                "folder": "bus",
+                "public_id": "bus_routes",
+                "resource_type": "raw",
+                "overwrite": True
+            },
+            target=uploads.target("bus", {"_id": bus["_id"]}, pdf_url="secure_url"),
+            # 🔔 GLOBAL NOTIFICATION (ALL USERS) — once the new PDF is live
+            announce={
+                "title": "🚌 Bus Route Updated",
+                "body": "New bus route PDF has been uploaded. Check routes now.",
+                "url": "/bus-route.html"
+            }
         )
 
         return jsonify({
             "success": True,
-            "message": "Bus PDF uploaded & notification sent",
-            "pdf_url": pdf_url
-        }), 201
+            "message": "Bus PDF upload queued, notification goes out when it's live",
+            "pdf_url": bus.get("pdf_url"),
+            "jobId": job_id
+        }), 202
 
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
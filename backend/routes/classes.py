@@ -1,12 +1,11 @@
 from flask import Blueprint, request, jsonify
-from pymongo import MongoClient
+from db import get_db
 
 classes_bp = Blueprint("classes_bp", __name__, url_prefix="/api/classes")
 
 
 # MongoDB connection
-client = MongoClient("mongodb://localhost:27017/")
-db = client["college"]  # Database name
+db = get_db("college")  # Database name
 
 # Branches, Years, Sections
 BRANCHES = ["CSE", "IT", "ECE", "AIML", "AIDS", "ME", "EX", "CIVIL"]
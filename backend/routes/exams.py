@@ -2,6 +2,8 @@ from flask import Blueprint, request, jsonify
 from db import db
 from utils import generate_id
 from flask_cors import cross_origin
+from cache import cached, invalidate
+from versions import conditional
 
 # 🔔 Notification helper
 from routes.notifications import send_to_class
@@ -14,6 +16,8 @@ exams_bp = Blueprint("exams_bp", __name__, url_prefix="/api/exams")
 # ---------------------------------------------------------
 @exams_bp.route('', methods=['GET'])
 @cross_origin()
+@conditional("exams")
+@cached("exams")
 def get_exams():
     class_name = request.args.get("class")
     query = {}
@@ -29,6 +33,8 @@ def get_exams():
 # ---------------------------------------------------------
 @exams_bp.route('/<examId>', methods=['GET'])
 @cross_origin()
+@conditional("exams")
+@cached("exams")
 def get_exam(examId):
     exam = db.exams.find_one({"examId": examId}, {"_id": 0})
     if not exam:
@@ -67,6 +73,7 @@ def post_exam():
 
     # Save to DB
     db.exams.insert_one(exam_doc)
+    invalidate("exams")
 
     # 🔔 CLASS-WISE NOTIFICATION
     send_to_class(
@@ -88,4 +95,5 @@ def delete_exam(examId):
     res = db.exams.delete_one({"examId": examId})
     if res.deleted_count == 0:
         return jsonify({"success": False, "message": "Exam not found"}), 404
+    invalidate("exams")
     return jsonify({"success": True, "message": "Exam deleted"}), 200
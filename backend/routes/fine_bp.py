@@ -1,14 +1,20 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import cross_origin
 from db import db
-from datetime import datetime
+from datetime import datetime, timedelta
 from bson.objectid import ObjectId
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from versions import conditional, bump
+from streaming import stream_json
+from pagination import Page, PageError, page_args
 import razorpay
 import os
 import hmac
 import hashlib
 import json
 
+from fine_ledger import settle_payment
+
 # 🔔 Notification helper
 from routes.notifications import notify_fine
 
@@ -25,35 +31,144 @@ def serialize(fine):
 # ---------------------------------------------------------
 # 1️⃣ ADMIN — BULK ADD FINES
 # ---------------------------------------------------------
+# Every fine carries a natural key (enrollment | reason | amount | day) with a
+# unique index, so the same row can't land twice on the same day. A batch may
+# also send an idempotency key (Idempotency-Key header or "idempotencyKey"):
+# the first request stores its per-row results in `fine_batches` and any retry
+# gets those results back without writing anything. A "processing" claim is a
+# lease: if its worker died mid-batch, a retry after FINE_BATCH_LEASE_SECONDS
+# takes it over (the natural keys keep the re-run from adding rows twice).
+FINE_BATCH_LEASE_SECONDS = int(os.getenv("FINE_BATCH_LEASE_SECONDS", 120))
+
+
+def fine_key(enrollment, reason, amount, day):
+    reason = " ".join(str(reason or "").lower().split())
+    return f"{enrollment}|{reason}|{amount}|{day}"
+
+
+def validate_fines(fines):
+    """(records, errors) — errors are per-row messages, nothing is written"""
+    now = datetime.now()
+    day = now.strftime("%Y-%m-%d")
+    records, errors = [], {}
+
+    for i, f in enumerate(fines):
+        if not isinstance(f, dict):
+            errors[i] = "Row must be an object"
+            continue
+
+        enrollment = str(f.get("enrollment") or "").strip().upper()
+        try:
+            amount = int(f.get("fine", 0))
+        except (TypeError, ValueError):
+            amount = 0
+
+        if not enrollment:
+            errors[i] = "enrollment required"
+        elif amount <= 0:
+            errors[i] = "fine must be a positive number"
+        if i in errors:
+            continue
+
+        reason = f.get("reason", "")
+        records.append({
+            "enrollment": enrollment,
+            "class": f.get("class"),
+            "fine": amount,
+            "reason": reason,
+            "status": "Unpaid",
+            "fineKey": fine_key(enrollment, reason, amount, day),
+            "createdAt": now,
+            "updatedAt": now
+        })
+
+    return records, errors
+
+
 @fine_bp.route("/bulk-add", methods=["POST"])
 def add_bulk_fines():
+    batch_key = None
     try:
-        data = request.get_json(force=True)
+        data = request.get_json(force=True) or {}
         fines = data.get("fines", [])
 
-        if not fines:
+        if not fines or not isinstance(fines, list):
             return jsonify({"success": False, "message": "No fines provided"}), 400
 
-        for f in fines:
-            record = {
-                "enrollment": f.get("enrollment"),
-                "class": f.get("class"),
-                "fine": int(f.get("fine", 0)),
-                "reason": f.get("reason", ""),
-                "status": "Unpaid",
-                "createdAt": datetime.now(),
-                "updatedAt": datetime.now()
-            }
-
-            db.fine.insert_one(record)
-
-        return jsonify({
+        records, errors = validate_fines(fines)
+        if errors:
+            return jsonify({
+                "success": False,
+                "message": f"{len(errors)} invalid row(s), nothing saved",
+                "errors": {str(i): msg for i, msg in errors.items()}
+            }), 400
+
+        # 🔹 idempotency — claim the key before writing
+        batch_key = request.headers.get("Idempotency-Key") or data.get("idempotencyKey")
+        if batch_key:
+            now = datetime.now()
+            lease = now + timedelta(seconds=FINE_BATCH_LEASE_SECONDS)
+            try:
+                db.fine_batches.insert_one({
+                    "_id": str(batch_key),
+                    "status": "processing",
+                    "leaseUntil": lease,
+                    "createdAt": now
+                })
+            except DuplicateKeyError:
+                batch = db.fine_batches.find_one({"_id": str(batch_key)})
+                if batch and batch.get("status") == "done":
+                    return jsonify({**batch["response"], "replayed": True}), 200
+
+                # take over a claim whose lease ran out (its worker died mid-batch)
+                taken = db.fine_batches.find_one_and_update(
+                    {
+                        "_id": str(batch_key),
+                        "status": "processing",
+                        "$or": [{"leaseUntil": {"$lt": now}}, {"leaseUntil": {"$exists": False}}]
+                    },
+                    {"$set": {"leaseUntil": lease, "takenOverAt": now}}
+                )
+                if not taken:
+                    return jsonify({"success": False, "message": "Batch already in progress"}), 409
+
+        # 🔹 ONE unordered insert — duplicates fail individually
+        results = ["created"] * len(records)
+        try:
+            db.fine.insert_many(records, ordered=False)
+        except BulkWriteError as e:
+            for err in e.details.get("writeErrors", []):
+                results[err["index"]] = "duplicate" if err.get("code") == 11000 else "failed"
+
+        created = results.count("created")
+        if created:
+            bump("fines")
+
+        response = {
             "success": True,
-            "message": "Fines added successfully"
-        }), 200
+            "message": f"{created} fine(s) added" + (
+                f", {len(results) - created} skipped" if created < len(results) else ""
+            ),
+            "inserted": created,
+            "results": [
+                {"enrollment": r["enrollment"], "status": status}
+                for r, status in zip(records, results)
+            ]
+        }
+
+        if batch_key:
+            db.fine_batches.update_one(
+                {"_id": str(batch_key)},
+                {"$set": {"status": "done", "response": response, "finishedAt": datetime.now()}}
+            )
+
+        return jsonify(response), 200
 
     except Exception as e:
         print("❌ bulk-add error:", e)
+        if batch_key:
+            # let the client retry with the same key
+            db.fine_batches.delete_one({"_id": str(batch_key), "status": "processing"})
         return jsonify({"success": False, "message": "Server error"}), 500
 
 
@@ -62,6 +177,7 @@ def add_bulk_fines():
 # ---------------------------------------------------------
 @fine_bp.route("/<enrollment>", methods=["GET"])
 @cross_origin()
+@conditional("fines")
 def get_student_fines(enrollment):
     records = list(db.fine.find({"enrollment": enrollment}))
     records = [serialize(r) for r in records]
@@ -86,14 +202,26 @@ def update_fine(fine_id):
 
         enrollment = fine_record["enrollment"]
 
-        db.fine.update_one(
-            {"_id": ObjectId(fine_id)},
-            {"$set": {
-                "fine": fine_amount,
-                "reason": reason,
-                "updatedAt": datetime.now()
-            }}
-        )
+        # natural key follows the row, still on the day it was issued
+        issued = fine_record.get("createdAt")
+        if not isinstance(issued, datetime):
+            issued = datetime.now()
+        try:
+            db.fine.update_one(
+                {"_id": ObjectId(fine_id)},
+                {"$set": {
+                    "fine": fine_amount,
+                    "reason": reason,
+                    "fineKey": fine_key(enrollment, reason, fine_amount, issued.strftime("%Y-%m-%d")),
+                    "updatedAt": datetime.now()
+                }}
+            )
+        except DuplicateKeyError:
+            return jsonify({
+                "success": False,
+                "message": "An identical fine already exists for this student on that day"
+            }), 409
+        bump("fines")
 
         return jsonify({
             "success": True,
@@ -111,6 +239,7 @@ def update_fine(fine_id):
 @cross_origin()
 def delete_fine(fine_id):
     db.fine.delete_one({"_id": ObjectId(fine_id)})
+    bump("fines")
     return jsonify({"success": True, "message": "Fine deleted"}), 200
 
 
@@ -119,6 +248,7 @@ def delete_fine(fine_id):
 # ---------------------------------------------------------
 @fine_bp.route("/student-dashboard/<enrollment>", methods=["GET"])
 @cross_origin()
+@conditional("fines")
 def student_dashboard(enrollment):
     rec = list(db.fine.find({"enrollment": enrollment}))
     rec = [serialize(r) for r in rec]
@@ -131,6 +261,7 @@ def student_dashboard(enrollment):
 # ---------------------------------------------------------
 @fine_bp.route("/public-check/<enrollment>", methods=["GET"])
 @cross_origin()
+@conditional("fines")
 def public_check(enrollment):
     rec = list(db.fine.find({"enrollment": enrollment}))
     rec = [serialize(r) for r in rec]
@@ -143,11 +274,16 @@ def public_check(enrollment):
 # ---------------------------------------------------------
 @fine_bp.route("/all", methods=["GET"])
 @cross_origin()
+@conditional("fines")
 def all_fines():
-    all_rec = list(db.fine.find())
-    all_rec = [serialize(r) for r in all_rec]
+    try:
+        args = page_args(request.args)
+    except PageError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
 
-    return jsonify({"success": True, "fines": all_rec}), 200
+    page = Page(db.fine, {}, None, args)
+    return stream_json(page, "fines", transform=serialize,
+                       tail=lambda: {"next_cursor": page.next_cursor})
 
 
 # ---------------------------------------------------------
@@ -206,7 +342,7 @@ def razorpay_webhook():
         hashlib.sha256
     ).hexdigest()
 
-    if not hmac.compare_digest(expected_signature, signature):
+    if not hmac.compare_digest(expected_signature, signature or ""):
         return "Invalid signature", 400
 
     event = json.loads(payload)
@@ -217,31 +353,10 @@ def razorpay_webhook():
         enrollment = payment["notes"].get("enrollment")
         amount_paid = payment["amount"] // 100
 
-        # 🔹 Insert transaction
-        db.payment_transactions.insert_one({
-            "enrollment": enrollment,
-            "amount_paid": amount_paid,
-            "razorpay_payment_id": payment["id"],
-            "razorpay_order_id": payment["order_id"],
-            "status": "success",
-            "createdAt": datetime.now()
-        })
-
-        # 🔹 Recalculate fine
-        fine = db.fine.find_one({"enrollment": enrollment})
-
-        total = fine["fine"]
-        paid = sum(t["amount_paid"] for t in db.payment_transactions.find({"enrollment": enrollment}))
-        pending = total - paid
-
-        status = "Paid" if pending <= 0 else "Partial"
-
-        db.fine.update_many(
-            {"enrollment": enrollment},
-            {"$set": {
-                "status": status,
-                "updatedAt": datetime.now()
-            }}
-        )
+        result = settle_payment(enrollment, amount_paid, payment)
+        if result is None:
+            print("ℹ️ Payment already settled:", payment["id"])
+        else:
+            bump("fines")
 
     return "OK", 200
\ No newline at end of file
@@ -5,7 +5,12 @@ import cloudinary.uploader
 from werkzeug.utils import secure_filename
 
 from db import db
+from cache import cached, invalidate
+from versions import conditional, bump
+from pagination import Page, PageError, page_args, encode_cursor
 import json
+import uploads
+import assets
 
 from auth.middleware import admin_required # teacher_required hata diya
 
@@ -24,6 +29,8 @@ submissions_col = db.form_submissions
 # GET ALL ACTIVE FORMS (STUDENT)
 # ==============================
 @forms_bp.route("/forms", methods=["GET"])
+@conditional("forms")
+@cached("forms")
 def get_forms():
     forms = []
     for f in forms_col.find({"active": True}).sort("created_at", -1):
@@ -41,6 +48,8 @@ def get_forms():
 # GET SINGLE FORM (STUDENT)
 # ==============================
 @forms_bp.route("/forms/<form_id>", methods=["GET"])
+@conditional("forms")
+@cached("forms")
 def get_single_form(form_id):
     form = forms_col.find_one({"_id": ObjectId(form_id), "active": True})
     if not form:
@@ -66,6 +75,7 @@ def submit_form(form_id):
         return jsonify({"error": "Invalid form"}), 404
 
     responses = {}
+    files = {}
 
     for field in form["fields"]:
         label = field["label"]
@@ -74,27 +84,37 @@ def submit_form(form_id):
         if field_type == "file":
             file = request.files.get(label)
             if file and file.filename:
-                upload = cloudinary.uploader.upload(
-                    file,
-                    resource_type="auto",   # ✅ FIX
-                    folder="forms/submissions",
-                    use_filename=True,
-                    unique_filename=False
-                )
-                responses[label] = upload["secure_url"]
+                files[label] = file
         else:
             responses[label] = request.form.get(label)
 
+    # 🔹 all attachments side by side — all succeed or none are kept
+    try:
+        uploaded = uploads.upload_many(files, {
+            "resource_type": "auto",   # ✅ FIX
+            "folder": "forms/submissions",
+            "use_filename": True,
+            "unique_filename": True    # cleanup must never hit another student's file
+        }) if files else {}
+    except uploads.UploadError as e:
+        print("❌ Submission upload failed:", e)
+        return jsonify({"error": f"Upload failed for {e.name}"}), 502
+
+    for label, upload in uploaded.items():
+        responses[label] = upload["secure_url"]
+
     submission = {
         "form_id": str(form_id),
         "form_title": form["title"],
         "enrollment": request.form.get("enrollment"),
         "student_name": request.form.get("student_name"),
         "responses": responses,
+        "upload_seconds": {label: u["seconds"] for label, u in uploaded.items()},
         "submitted_at": datetime.utcnow()
     }
 
     submissions_col.insert_one(submission)
+    bump("form_submissions")
 
     return jsonify({"message": "Form submitted successfully"}), 201
 
@@ -103,20 +123,36 @@ def submit_form(form_id):
 # GET FORMS WITH SUBMISSION COUNT (ADMIN / TEACHER)
 # ==============================
 @forms_bp.route("/admin/forms", methods=["GET"])
+@conditional("forms", "form_submissions")
 # @admin_required
 def get_forms_admin():
-    forms = []
-    for f in forms_col.find():
-        count = submissions_col.count_documents({
-            "form_id": str(f["_id"])   # ✅ STRING MATCH
-        })
-        forms.append({
-            "id": str(f["_id"]),
-            "name": f["title"],
-            "submissions": count
-        })
+    try:
+        args = page_args(request.args, allowed_fields=set())
+    except PageError as e:
+        return jsonify({"error": str(e)}), 400
+
+    page = list(Page(forms_col, {}, {"title": 1}, args))
+    ids = [str(f["_id"]) for f in page]
+
+    # one $group for all submission counts on this page
+    counts = {
+        row["_id"]: row["count"]
+        for row in submissions_col.aggregate([
+            {"$match": {"form_id": {"$in": ids}}},   # ✅ STRING MATCH
+            {"$group": {"_id": "$form_id", "count": {"$sum": 1}}}
+        ])
+    }
 
-    return jsonify(forms), 200
+    forms = [{
+        "id": str(f["_id"]),
+        "name": f["title"],
+        "submissions": counts.get(str(f["_id"]), 0)
+    } for f in page]
+
+    resp = jsonify(forms)
+    if args["limit"] and len(page) >= args["limit"]:
+        resp.headers["X-Next-Cursor"] = encode_cursor(page[-1]["_id"])
+    return resp, 200
 
 
 # ==============================
@@ -180,32 +216,40 @@ def create_form():
         except Exception:
             return jsonify({"error": "Invalid fields format"}), 400
 
-        pdf_urls = []
+        pdfs = [p for p in request.files.getlist("pdfs") if p and p.filename]
 
-        if "pdfs" in request.files:
-            pdfs = request.files.getlist("pdfs")
-            for pdf in pdfs:
-                upload = cloudinary.uploader.upload(
-                    pdf,
-                    resource_type="raw",
-                    folder="forms/pdfs"
-                )
-                pdf_urls.append(upload["secure_url"])
+        # 🔹 attachments side by side — the form only goes live once all are stored
+        try:
+            uploaded = uploads.upload_many(
+                {i: pdf for i, pdf in enumerate(pdfs)},
+                {"resource_type": "raw", "folder": "forms/pdfs"},
+                dedup=True
+            ) if pdfs else {}
+        except uploads.UploadError as e:
+            print("❌ Form attachment upload failed:", e)
+            return jsonify({"error": f"Upload failed for {pdfs[e.name].filename}"}), 502
 
         form_doc = {
             "title": title,
             "description": description,
             "fields": fields,
-            "pdfs": pdf_urls,
+            "pdfs": [uploaded[i]["secure_url"] for i in range(len(pdfs))],
+            "pdfAssets": [uploaded[i].get("asset_id") for i in range(len(pdfs))],
             "active": True,
             "created_at": datetime.utcnow()
         }
 
-        result = forms_col.insert_one(form_doc)
+        try:
+            result = forms_col.insert_one(form_doc)
+        except Exception:
+            uploads.undo(uploaded.values())
+            raise
+        invalidate("forms")
 
         return jsonify({
             "success": True,
             "form_id": str(result.inserted_id),
+            "pdfs": form_doc["pdfs"],
             "message": "Form created successfully"
         }), 201
 
@@ -282,12 +326,14 @@ def update_submission_status(submission_id):
     if result.matched_count == 0:
         return jsonify({"error": "Submission not found"}), 404
 
+    bump("form_submissions")
     return jsonify({"message": f"Submission marked as {status}"}), 200
 
 # ==============================
 # GET MY SUBMITTED FORMS (STUDENT)
 # ==============================
 @forms_bp.route("/student/my-submissions", methods=["GET"])
+@conditional("form_submissions")
 def get_my_submissions():
     enrollment = request.args.get("enrollment")
 
@@ -350,9 +396,16 @@ def delete_form(form_id):
             "message": "Form not found"
         }), 404
 
-    # 3️⃣ Delete PDFs from Cloudinary (URL → public_id)
-    for pdf_url in form.get("pdfs", []):
+    # 3️⃣ Delete PDFs from Cloudinary (shared ones only with the last reference)
+    pdf_assets = form.get("pdfAssets") or []
+    for i, pdf_url in enumerate(form.get("pdfs", [])):
         try:
+            if i < len(pdf_assets) and pdf_assets[i]:
+                assets.release(pdf_assets[i])
+                continue
+            if not pdf_url:
+                continue
+
             # Example URL:
             # https://res.cloudinary.com/demo/raw/upload/v123/forms_pdfs/filename.pdf
             public_id = pdf_url.split("/upload/")[1]
@@ -367,6 +420,7 @@ def delete_form(form_id):
 
     # 4️⃣ Delete form from DB
     forms_col.delete_one({"_id": obj_id})
+    invalidate("forms")
 
     return jsonify({
         "success": True,
@@ -1,8 +1,8 @@
 from flask import Blueprint, request, jsonify
-from pymongo import MongoClient
+from db import get_db
+from utils import norm_key
 
-client = MongoClient("mongodb://localhost:27017/")
-db = client["college_db"]
+db = get_db("college_db")
 students_collection = db["students"]
 
 management_bp = Blueprint("management_bp", __name__)
@@ -36,6 +36,7 @@ def add_single_student():
 
         students_collection.insert_one({
             "branch": branch,
+            "branch_norm": norm_key(branch),
             "enrollment": enrollment,
             "name": ""     # default empty
         })
@@ -69,6 +70,7 @@ def add_bulk_students():
             if not students_collection.find_one({"branch": branch, "enrollment": enr}):
                 students_collection.insert_one({
                     "branch": branch,
+                    "branch_norm": norm_key(branch),
                     "enrollment": enr,
                     "name": ""
                 })
@@ -1,63 +1,97 @@
 from flask import Blueprint, jsonify, request
+from pymongo import ReplaceOne, UpdateOne, DeleteOne
+from collections import Counter
 import os
 import json
 
+from db import db
+from utils import norm_enrollment
+
 # 🔔 Notification helper
 from routes.notifications import send_to_enrollment as send_notification_to_enrollment
+from routes.notifications import queue_to_enrollments
 
 marks_bp = Blueprint("marks_bp", __name__)
 
-DATA_FILE = os.path.join("data", "marks.json")
+# Old flat-file store — only read once to migrate into Mongo
+DATA_FILE = os.path.join(os.path.dirname(__file__), "..", "data", "marks.json")
+
+marks_collection = db["marks"]
 
-def load_marks():
-    if not os.path.exists(DATA_FILE):
-        return {}
-    with open(DATA_FILE, "r") as f:
+
+def migrate_marks_json(path=DATA_FILE):
+    """Import data/marks.json into the marks collection (safe to re-run)"""
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r") as f:
         try:
-            return json.load(f)
+            data = json.load(f)
         except Exception:
-            return {}
+            return 0
 
-def save_marks(data):
-    os.makedirs(os.path.dirname(DATA_FILE), exist_ok=True)
-    with open(DATA_FILE, "w") as f:
-        json.dump(data, f, indent=4)
+    records = {}
+    for enrollment, record in data.items():
+        key = norm_enrollment(enrollment)
+        if key:
+            records[key] = {**record, "enrollment": key}
 
-# -----------------------------
-# GET marks by enrollment
-# -----------------------------
-@marks_bp.route("/api/marks/<enrollment>", methods=["GET"])
-def get_marks(enrollment):
-    data = load_marks()
-    student = data.get(enrollment)
-    if not student:
-        return jsonify({"success": False, "message": "No marks found for this enrollment"}), 404
-    return jsonify({"success": True, "marks": student})
+    ops = [ReplaceOne({"enrollment": key}, record, upsert=True) for key, record in records.items()]
+    if ops:
+        marks_collection.bulk_write(ops, ordered=False)
+    return len(ops)
 
-# -----------------------------
-# POST/UPDATE marks
-# -----------------------------
-@marks_bp.route("/api/marks", methods=["POST"])
-def post_marks():
-    payload = request.get_json() or {}
-    enrollment = payload.get("enrollment")
-    if not enrollment:
-        return jsonify({"success": False, "message": "enrollment is required"}), 400
 
-    def number_of(x):
-        try:
-            return float(x)
-        except Exception:
-            return 0.0
+def normalize_stored_enrollments():
+    """
+    Rewrite records stored under an un-normalized enrollment. If the
+    normalized record already exists it was written later, so the old one goes.
+    """
+    legacy = list(marks_collection.find(
+        {"enrollment": {"$regex": r"[a-z]|^\s|\s$"}}, {"enrollment": 1}
+    ))
+    if not legacy:
+        return 0
 
-    mst = number_of(payload.get("mst", 0))
-    internal = number_of(payload.get("internal", 0))
-    assignments = number_of(payload.get("assignments", 0))
+    keys = {d["_id"]: norm_enrollment(d["enrollment"]) for d in legacy}
+    existing = {
+        d["enrollment"]
+        for d in marks_collection.find({"enrollment": {"$in": list(set(keys.values()))}}, {"enrollment": 1})
+    }
+    ops = []
+    for _id, key in keys.items():
+        if key in existing:
+            ops.append(DeleteOne({"_id": _id}))
+        else:
+            ops.append(UpdateOne({"_id": _id}, {"$set": {"enrollment": key}}))
+            existing.add(key)
+    marks_collection.bulk_write(ops, ordered=False)
+    return len(ops)
+
+
+def migrate_marks():
+    """Startup migration: marks.json → Mongo on first run, then normalize keys"""
+    if marks_collection.estimated_document_count() == 0:
+        migrated = migrate_marks_json()
+        if migrated:
+            print(f"✅ Migrated {migrated} marks records from marks.json")
+    fixed = normalize_stored_enrollments()
+    if fixed:
+        print(f"✅ Normalized {fixed} legacy marks enrollments")
 
-    weights = payload.get("weights") or {}
-    w_mst = float(weights.get("mst", 0)) if isinstance(weights, dict) and weights.get("mst") is not None else None
-    w_internal = float(weights.get("internal", 0)) if isinstance(weights, dict) and weights.get("internal") is not None else None
-    w_assign = float(weights.get("assignments", 0)) if isinstance(weights, dict) and weights.get("assignments") is not None else None
+
+def number_of(x):
+    try:
+        return float(x)
+    except Exception:
+        return 0.0
+
+
+def normalize_weights(weights):
+    """{"mst", "internal", "assignments"} → fractions summing to 1 (equal if missing)"""
+    weights = weights if isinstance(weights, dict) else {}
+    w_mst = float(weights["mst"]) if weights.get("mst") is not None else None
+    w_internal = float(weights["internal"]) if weights.get("internal") is not None else None
+    w_assign = float(weights["assignments"]) if weights.get("assignments") is not None else None
 
     if w_mst is not None or w_internal is not None or w_assign is not None:
         w_mst = w_mst or 0.0
@@ -65,18 +99,23 @@ def post_marks():
         w_assign = w_assign or 0.0
         total_w = w_mst + w_internal + w_assign
         if total_w <= 0:
-            w_mst = w_internal = w_assign = 1/3
-        else:
-            w_mst /= total_w
-            w_internal /= total_w
-            w_assign /= total_w
-    else:
-        w_mst = w_internal = w_assign = 1/3
+            return 1/3, 1/3, 1/3
+        return w_mst / total_w, w_internal / total_w, w_assign / total_w
+
+    return 1/3, 1/3, 1/3
+
+
+def build_record(payload, weights=None):
+    mst = number_of(payload.get("mst", 0))
+    internal = number_of(payload.get("internal", 0))
+    assignments = number_of(payload.get("assignments", 0))
+
+    w_mst, w_internal, w_assign = weights or normalize_weights(payload.get("weights"))
 
     percentage = round((mst * w_mst) + (internal * w_internal) + (assignments * w_assign), 2)
 
-    record = {
-        "enrollment": enrollment,
+    return {
+        "enrollment": norm_enrollment(payload.get("enrollment")),
         "name": payload.get("name", ""),
         "class": payload.get("class", ""),
         "mst": mst,
@@ -87,9 +126,43 @@ def post_marks():
         "notes": payload.get("notes", "")
     }
 
-    data = load_marks()
-    data[enrollment] = record
-    save_marks(data)
+
+def save_records(records):
+    """Upsert many mark records in one round trip"""
+    ops = [ReplaceOne({"enrollment": r["enrollment"]}, r, upsert=True) for r in records]
+    if ops:
+        marks_collection.bulk_write(ops, ordered=False)
+
+
+# -----------------------------
+# GET marks by enrollment
+# -----------------------------
+@marks_bp.route("/api/marks/<enrollment>", methods=["GET"])
+def get_marks(enrollment):
+    # records saved before enrollments were normalized may still be stored as typed
+    student = marks_collection.find_one(
+        {"enrollment": {"$in": list({norm_enrollment(enrollment), enrollment})}},
+        {"_id": 0}
+    )
+    if not student:
+        return jsonify({"success": False, "message": "No marks found for this enrollment"}), 404
+    return jsonify({"success": True, "marks": student})
+
+# -----------------------------
+# POST/UPDATE marks
+# -----------------------------
+@marks_bp.route("/api/marks", methods=["POST"])
+def post_marks():
+    payload = request.get_json() or {}
+    enrollment = norm_enrollment(payload.get("enrollment"))
+    if not enrollment:
+        return jsonify({"success": False, "message": "enrollment is required"}), 400
+
+    record = build_record(payload)
+    percentage = record["percentage"]
+
+    marks_collection.replace_one({"enrollment": enrollment}, record, upsert=True)
+    record.pop("_id", None)
 
     # 🔔 SEND notification to student
     try:
@@ -101,3 +174,179 @@ def post_marks():
         print("Notification error:", e)
 
     return jsonify({"success": True, "message": "Marks saved & notification sent", "marks": record})
+
+# -----------------------------
+# POST whole-class mark sheet (JSON)
+# -----------------------------
+@marks_bp.route("/api/marks/bulk", methods=["POST"])
+def post_marks_bulk():
+    payload = request.get_json() or {}
+    rows = payload.get("records") or []
+    if not isinstance(rows, list) or not rows:
+        return jsonify({"success": False, "message": "records list is required"}), 400
+
+    # sheet-level weights apply to every row unless a row brings its own
+    sheet_weights = normalize_weights(payload.get("weights")) if payload.get("weights") else None
+
+    counts = Counter(norm_enrollment(r.get("enrollment")) for r in rows if isinstance(r, dict))
+
+    records = []
+    errors = []
+    for i, row in enumerate(rows):
+        if not isinstance(row, dict) or not norm_enrollment(row.get("enrollment")):
+            errors.append({"row": i, "message": "enrollment is required"})
+            continue
+        if counts[norm_enrollment(row.get("enrollment"))] > 1:
+            errors.append({"row": i, "message": "duplicate enrollment"})
+            continue
+        if payload.get("class") and not row.get("class"):
+            row = {**row, "class": payload["class"]}
+        records.append(build_record(row, None if row.get("weights") else sheet_weights))
+
+    if errors:
+        return jsonify({"success": False, "message": "Invalid rows", "errors": errors}), 400
+
+    save_records(records)
+
+    notify_sheet(records)
+
+    return jsonify({"success": True, "saved": len(records)}), 200
+
+
+def notify_sheet(records):
+    """🔔 ONE batched notification for the whole sheet"""
+    try:
+        queue_to_enrollments(
+            [r["enrollment"] for r in records],
+            "📊 Marks Updated",
+            "Your MST/Internal/Assignment marks have been updated.",
+            "/marks.html"
+        )
+    except Exception as e:
+        print("Notification error:", e)
+
+
+# -----------------------------
+# POST whole-class mark sheet (CSV / XLSX upload)
+# -----------------------------
+SHEET_COLUMNS = ["enrollment", "name", "mst", "internal", "assignments", "notes"]
+SCORE_COLUMNS = ["mst", "internal", "assignments"]
+MAX_SHEET_ROWS = 2000
+
+
+def read_sheet(file):
+    """Uploaded CSV/XLSX → DataFrame with lower-cased headers"""
+    import pandas as pd   # heavy — only loaded when a sheet is uploaded
+
+    name = (file.filename or "").lower()
+    if name.endswith(".csv"):
+        df = pd.read_csv(file, dtype=str, keep_default_na=False)
+    elif name.endswith(".xlsx"):
+        df = pd.read_excel(file, dtype=str, keep_default_na=False, engine="openpyxl")
+    elif name.endswith(".xls"):
+        # legacy Excel needs xlrd, which isn't a dependency
+        raise ValueError("Legacy .xls files aren't supported — save the sheet as .xlsx or .csv")
+    else:
+        raise ValueError("Only .csv or .xlsx files are allowed")
+
+    df.columns = [str(c).strip().lower() for c in df.columns]
+    return df
+
+
+def score_sheet(df, weights):
+    """
+    Validate + score every row at once.
+    Returns (records, errors) — errors carry the 1-based sheet row number
+    """
+    import numpy as np
+    import pandas as pd
+
+    for col in SHEET_COLUMNS:
+        if col not in df.columns:
+            df[col] = ""
+
+    df["enrollment"] = df["enrollment"].map(norm_enrollment)   # same key as the single-entry path
+
+    # blank → 0 (same as single POST), anything else must be numeric
+    raw = df[SCORE_COLUMNS].apply(lambda c: c.astype(str).str.strip())
+    scores = raw.replace("", "0").apply(pd.to_numeric, errors="coerce")
+
+    bad_score = scores.isna().any(axis=1)
+    no_enrollment = df["enrollment"] == ""
+    duplicate = df["enrollment"].duplicated(keep=False) & ~no_enrollment
+
+    errors = []
+    for idx in np.flatnonzero((bad_score | no_enrollment | duplicate).to_numpy()):
+        if no_enrollment.iat[idx]:
+            msg = "enrollment is required"
+        elif duplicate.iat[idx]:
+            msg = "duplicate enrollment"
+        else:
+            cols = [c for c in SCORE_COLUMNS if pd.isna(scores[c].iat[idx])]
+            msg = f"non-numeric {', '.join(cols)}"
+        errors.append({"row": int(idx) + 2, "message": msg})   # +1 header, +1 1-based
+
+    if errors:
+        return [], errors
+
+    # 🔹 vectorized weighting: (rows × 3) · (3,)
+    w = np.array(weights, dtype=float)
+    matrix = scores.to_numpy(dtype=float)
+    percentage = np.round(matrix @ w, 2)
+
+    weights_doc = {c: round(float(x), 4) for c, x in zip(SCORE_COLUMNS, w)}
+    records = [
+        {
+            "enrollment": enr,
+            "name": name,
+            "class": cls,
+            "mst": float(m[0]),
+            "internal": float(m[1]),
+            "assignments": float(m[2]),
+            "weights": weights_doc,
+            "percentage": float(p),
+            "notes": notes
+        }
+        for enr, name, cls, notes, m, p in zip(
+            df["enrollment"], df["name"], df["class"], df["notes"], matrix, percentage
+        )
+    ]
+    return records, []
+
+
+@marks_bp.route("/api/marks/upload", methods=["POST"])
+def upload_mark_sheet():
+    file = request.files.get("file")
+    class_name = request.form.get("class", "")
+
+    if not file or not file.filename:
+        return jsonify({"success": False, "message": "file is required"}), 400
+
+    try:
+        weights = normalize_weights(json.loads(request.form.get("weights") or "{}"))
+    except Exception:
+        return jsonify({"success": False, "message": "Invalid weights"}), 400
+
+    try:
+        df = read_sheet(file)
+    except ValueError as e:
+        return jsonify({"success": False, "message": str(e)}), 400
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Could not read sheet: {e}"}), 400
+
+    if df.empty:
+        return jsonify({"success": False, "message": "Sheet is empty"}), 400
+    if len(df) > MAX_SHEET_ROWS:
+        return jsonify({"success": False, "message": f"Max {MAX_SHEET_ROWS} rows per sheet"}), 400
+
+    if "class" not in df.columns or class_name:
+        df["class"] = class_name
+
+    records, errors = score_sheet(df, weights)
+    if errors:
+        return jsonify({"success": False, "message": "Invalid rows", "errors": errors}), 400
+
+    save_records(records)
+    notify_sheet(records)
+
+    return jsonify({"success": True, "saved": len(records)}), 200
@@ -1,11 +1,14 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import CORS
-from pymongo import MongoClient
+from db import get_db
+from cache import cached, invalidate
+from versions import conditional
 from datetime import datetime
 from urllib.parse import unquote
 import os
 import cloudinary
 import cloudinary.uploader
+import uploads
 
 # 🔔 Notification helpers
 from routes.notifications import send_to_class, send_global #as notify_notices
@@ -20,8 +23,7 @@ MONGO_URI = os.getenv("MONGO_COLLEGE_DB_URI")
 if not MONGO_URI:
     raise Exception("MONGO_COLLEGE_DB_URI not set in environment variables")
 
-client = MongoClient(MONGO_URI)
-db = client["college_db"]
+db = get_db("college_db")
 notices_collection = db["notices"]
 students_collection = db["students"]
 
@@ -52,14 +54,6 @@ def add_notice():
 
         image_url = None
 
-        # 🔹 Optional image upload
-        if "image" in request.files:
-            upload = cloudinary.uploader.upload(
-                request.files["image"],
-                folder="college_notices"
-            )
-            image_url = upload.get("secure_url")
-
         notice = {
             "title": title,
             "message": message,
@@ -71,7 +65,17 @@ def add_notice():
             "readBy": []
         }
 
-        notices_collection.insert_one(notice)
+        result = notices_collection.insert_one(notice)
+        invalidate("notices")
+
+        # 🔹 Optional image upload (background — imageUrl is set when done)
+        job_id = None
+        if "image" in request.files:
+            job_id = uploads.submit(
+                request.files["image"],
+                {"folder": "college_notices"},
+                target=uploads.target("notices", {"_id": result.inserted_id}, imageUrl="secure_url")
+            )
 
         # 🔔 SEND NOTIFICATION
         if target == "all":
@@ -88,7 +92,7 @@ def add_notice():
                 url="/notices.html"
             )
 
-        return jsonify({"success": True, "message": "Notice added & notification sent"}), 201
+        return jsonify({"success": True, "message": "Notice added & notification sent", "jobId": job_id}), 201
 
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
@@ -98,6 +102,8 @@ def add_notice():
 # 2️⃣  FETCH NOTICES (Student / Mentor)
 # =====================================
 @notices_bp.route("", methods=["GET"], strict_slashes=False)
+@conditional("notices")
+@cached("notices")
 def get_all_notices():
     try:
         user_type = request.args.get("target", "all")
@@ -155,6 +161,7 @@ def mark_notice_as_read():
         if result.matched_count == 0:
             return jsonify({"success": False, "message": "Notice not found"}), 404
 
+        invalidate("notices")   # is_read is part of the cached list
         return jsonify({"success": True, "message": "Notice marked as read"}), 200
 
     except Exception as e:
@@ -173,6 +180,7 @@ def delete_notice(title):
         if result.deleted_count == 0:
             return jsonify({"success": False, "message": f"Notice '{title}' not found"}), 404
 
+        invalidate("notices")
         return jsonify({"success": True, "message": f"Notice '{title}' deleted successfully"}), 200
 
     except Exception as e:
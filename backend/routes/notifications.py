@@ -1,20 +1,63 @@
 from flask import Blueprint, request, jsonify
-from pymongo import MongoClient
+from db import get_db
 import firebase_admin
 from firebase_admin import credentials, messaging
-from datetime import datetime
-import os, json
+from firebase_admin import exceptions as firebase_exceptions
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+import os, json, time, uuid
 from pywebpush import webpush
+from bson import ObjectId
 
 notifications_bp = Blueprint('notifications', __name__)
 
 # -------------------- DATABASE SETUP --------------------
-client = MongoClient(os.getenv("MONGO_COLLEGE_DB_URI"))
-db = client['college_db']
+db = get_db("college_db")
 
-tokens_col = db['fcm_tokens']             # Store student FCM tokens
+tokens_col = db['fcm_tokens']             # Store student FCM tokens (strings only)
+webpush_col = db['webpush_subscriptions'] # Store web-push subscription objects
 notifications_col = db['notifications']   # Store sent notifications history/log
 
+# indexes (token health, inbox, TTL retention) are declared in indexes.py
+reads_col = db['notification_reads']      # per-enrollment "read up to" watermark
+
+INBOX_PAGE_SIZE = 100
+UNREAD_CAP = 99                           # badge shows "99+"
+
+# tokens with no delivery (and no re-save) for this long are skipped on fan-out
+TOKEN_STALE_DAYS = int(os.getenv("FCM_TOKEN_STALE_DAYS", 60))
+
+def split_webpush_tokens():
+    """Old /api/subscribe wrote subscription objects into fcm_tokens.token — move them out"""
+    moved = 0
+    for doc in tokens_col.find({"token": {"$type": "object"}}):
+        webpush_col.update_one(
+            {"enrollment": doc.get("enrollment")},
+            {"$setOnInsert": {"subscription": doc["token"], "updatedAt": datetime.utcnow()}},
+            upsert=True
+        )
+        tokens_col.delete_one({"_id": doc["_id"]})
+        moved += 1
+    return moved
+
+
+def migrate_tokens():
+    """
+    Startup / maintenance step (app.py runs it, not this import):
+    split web-push objects out, and give tokens saved before token health
+    existed an updatedAt so their stale window starts now instead of at once.
+    """
+    try:
+        moved = split_webpush_tokens()
+        stamped = tokens_col.update_many(
+            {"updatedAt": {"$exists": False}},
+            {"$set": {"updatedAt": datetime.utcnow()}}
+        ).modified_count
+        return {"moved": moved, "stamped": stamped}
+    except Exception as e:
+        print("⚠️ FCM token migration failed:", e)
+        return None
+
 # -------------------- FIREBASE ADMIN SETUP --------------------
 # Initialize Firebase only once
 firebase_json = os.getenv("FIREBASE_SERVICE_ACCOUNT_JSON")
@@ -31,62 +74,174 @@ if firebase_json:
 else:
     print("⚠️ Firebase disabled: FIREBASE_SERVICE_ACCOUNT_JSON not set")
 
+# -------------------- DISPATCH SETTINGS --------------------
+FCM_BATCH_SIZE = 500                  # FCM multicast hard limit
+FCM_MAX_RETRIES = int(os.getenv("FCM_MAX_RETRIES", 3))
+FCM_RETRY_BACKOFF = float(os.getenv("FCM_RETRY_BACKOFF", 0.5))   # seconds, doubles per retry
+
+# jobs = one notification (resolve tokens → send → log)
+# batches = 500-token multicasts of a job, sent side by side
+_job_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("NOTIFY_WORKERS", 2)),
+    thread_name_prefix="notify-job"
+)
+_batch_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("NOTIFY_BATCH_WORKERS", 4)),
+    thread_name_prefix="notify-batch"
+)
+
+# NOTIFY_SYNC=1 → send inline (scripts / debugging)
+NOTIFY_SYNC = os.getenv("NOTIFY_SYNC") == "1"
+
+# FCM says the token will never work again → evict it.
+# INVALID_ARGUMENT / NOT_FOUND are left out on purpose: they usually mean
+# the message itself was bad, and would wipe every recipient of it.
+DEAD_TOKEN_ERRORS = (
+    messaging.UnregisteredError,
+    messaging.SenderIdMismatchError,
+)
+
+TRANSIENT_ERRORS = (
+    firebase_exceptions.UnavailableError,
+    firebase_exceptions.InternalError,
+    firebase_exceptions.DeadlineExceededError,
+    messaging.QuotaExceededError,
+)
+
+
 # -------------------- HELPER FUNCTION --------------------
-def send_fcm_notification(title, body, tokens, url="/"):
+def chunked(items, size=FCM_BATCH_SIZE):
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
+
+
+def _send_batch(title, body, tokens, url):
     """
-    Production-safe FCM sender
-    - Filters invalid tokens
-    - Sends proper string data
+    One multicast (<= 500 tokens) with retry + exponential backoff.
+    Returns {token: None (delivered) | exception}
     """
-    # ❌ remove empty / null tokens
-    tokens = [t for t in tokens if t]
+    results = {}
+    pending = list(tokens)
+
+    for attempt in range(FCM_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(FCM_RETRY_BACKOFF * (2 ** (attempt - 1)))
+
+        message = messaging.MulticastMessage(
+            notification=messaging.Notification(
+                title=title,
+                body=body
+            ),
+            data={"url": str(url)},       # DATA MUST BE STRING
+            tokens=pending
+        )
 
-    if not tokens:
-        return {
-            "success_count": 0,
-            "failure_count": 0,
-            "message": "No valid tokens"
-        }
+        try:
+            response = messaging.send_each_for_multicast(message)
+        except Exception as e:
+            # whole batch failed (network / auth) → retry everything
+            for t in pending:
+                results[t] = e
+            if attempt < FCM_MAX_RETRIES:
+                continue
+            break
+
+        retry = []
+        for token, r in zip(pending, response.responses):
+            if r.success:
+                results[token] = None
+            else:
+                results[token] = r.exception
+                if isinstance(r.exception, TRANSIENT_ERRORS):
+                    retry.append(token)
+
+        if not retry:
+            break
+        pending = retry
+
+    return results
+
+
+def send_tokens(title, body, tokens, url="/"):
+    """
+    Send to any number of tokens: split into 500-token batches,
+    batches go out concurrently. Returns {token: None | exception}
+    """
+    # ❌ remove empty / null / duplicate tokens (web-push dicts aren't FCM tokens)
+    tokens = list(dict.fromkeys(t for t in tokens if t and isinstance(t, str)))
 
-    # 🔔 payload (DATA MUST BE STRING)
-    payload_data = {
-        "url": str(url)
-    }
+    batches = list(chunked(tokens))
+    if len(batches) <= 1:
+        results = _send_batch(title, body, tokens, url) if tokens else {}
+    else:
+        results = {}
+        futures = [_batch_pool.submit(_send_batch, title, body, b, url) for b in batches]
+        for f in futures:
+            results.update(f.result())
+
+    record_delivery(results)
+    return results
+
+
+def record_delivery(results):
+    """
+    Token health bookkeeping after a send:
+    - delivered → lastSuccessAt, failure streak reset
+    - UNREGISTERED / SENDER_ID_MISMATCH → token evicted
+    - anything else → failure streak +1
+    """
+    if not results:
+        return
+
+    delivered = [t for t, e in results.items() if e is None]
+    dead = [t for t, e in results.items() if isinstance(e, DEAD_TOKEN_ERRORS)]
+    failed = [t for t, e in results.items() if e is not None and t not in dead]
 
     try:
-        # 🔹 SINGLE TOKEN
-        if len(tokens) == 1:
-            message = messaging.Message(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body
-                ),
-                data=payload_data,
-                token=tokens[0]
+        now = datetime.utcnow()
+        if delivered:
+            tokens_col.update_many(
+                {"token": {"$in": delivered}},
+                {"$set": {"lastSuccessAt": now, "failureCount": 0}}
             )
-            response = messaging.send(message)
-            return {
-                "success_count": 1,
-                "failure_count": 0,
-                "message_id": response
-            }
-
-        # 🔹 MULTIPLE TOKENS
-        else:
-            message = messaging.MulticastMessage(
-                notification=messaging.Notification(
-                    title=title,
-                    body=body
-                ),
-                data=payload_data,
-                tokens=tokens
+        if dead:
+            tokens_col.delete_many({"token": {"$in": dead}})
+            print(f"🧹 Evicted {len(dead)} dead FCM tokens")
+        if failed:
+            tokens_col.update_many(
+                {"token": {"$in": failed}},
+                {"$inc": {"failureCount": 1}, "$set": {"lastFailureAt": now}}
             )
-            response = messaging.send_multicast(message)
-            return {
-                "success_count": response.success_count,
-                "failure_count": response.failure_count
-            }
+    except Exception as e:
+        print("⚠️ Token health update failed:", e)
+
+
+def live_tokens(query=None):
+    """
+    FCM tokens matching `query`, minus stale ones
+    (no delivery AND no re-save within TOKEN_STALE_DAYS — a token that was
+    never delivered to counts from when it was saved)
+    """
+    cutoff = datetime.utcnow() - timedelta(days=TOKEN_STALE_DAYS)
+    stale = {
+        "$and": [
+            {"$or": [{"lastSuccessAt": {"$lt": cutoff}}, {"lastSuccessAt": {"$exists": False}}]},
+            {"updatedAt": {"$lt": cutoff}},
+        ]
+    }
+    q = {"$and": [query or {}, {"$nor": [stale]}, {"token": {"$type": "string"}}]}
+    return tokens_col.find(q, {"_id": 0, "enrollment": 1, "token": 1})
 
+
+def send_fcm_notification(title, body, tokens, url="/"):
+    """
+    Production-safe FCM sender
+    - Filters invalid tokens
+    - Sends proper string data
+    - Batches of 500 with retry
+    """
+    try:
+        results = send_tokens(title, body, tokens, url)
     except Exception as e:
         print("❌ FCM SEND ERROR:", e)
         return {
@@ -95,6 +250,19 @@ def send_fcm_notification(title, body, tokens, url="/"):
             "error": str(e)
         }
 
+    if not results:
+        return {
+            "success_count": 0,
+            "failure_count": 0,
+            "message": "No valid tokens"
+        }
+
+    failures = sum(1 for r in results.values() if r is not None)
+    return {
+        "success_count": len(results) - failures,
+        "failure_count": failures
+    }
+
 
 def log_notification(title, body, target_type, target, extra_data, result):
     """Store sent notification in DB"""
@@ -122,39 +290,155 @@ def save_token():
     if not token or not enrollment:
         return jsonify({"success": False, "message": "Missing token or enrollment"}), 400
 
+    if not isinstance(token, str):
+        return jsonify({"success": False, "message": "FCM token must be a string"}), 400
+
     tokens_col.update_one(
         {'enrollment': enrollment},
-        {'$set': {'token': token, 'studentClass': student_class}},
+        {'$set': {
+            'token': token,
+            'studentClass': student_class,
+            'updatedAt': datetime.utcnow(),
+            'failureCount': 0
+        }},
         upsert=True
     )
     return jsonify({"success": True, "message": "Token saved"})
 
 
+# -------------------- DISPATCH QUEUE --------------------
+def _run_job(job_id, title, body, target_type, target, url, resolve_tokens):
+    try:
+        tokens = resolve_tokens()
+        if not tokens:
+            result = {"success_count": 0, "failure_count": 1, "message": "No token for target"}
+        else:
+            result = send_fcm_notification(title, body, tokens, url)
+        log_notification(title, body, target_type, target, {"url": url, "job_id": job_id}, result)
+        return result
+    except Exception as e:
+        print(f"❌ Notification job {job_id} failed:", e)
+        return {"success_count": 0, "failure_count": 0, "error": str(e)}
+
+
+def dispatch(title, body, target_type, target, url, resolve_tokens):
+    """
+    Queue a notification. Tokens are resolved, sent and logged on the
+    worker pool so the calling request returns immediately.
+    """
+    job_id = uuid.uuid4().hex[:12]
+    args = (job_id, title, body, target_type, target, url, resolve_tokens)
+
+    if NOTIFY_SYNC:
+        return _run_job(*args)
+
+    _job_pool.submit(_run_job, *args)
+    return {"queued": True, "job_id": job_id}
+
+
 # 2️⃣ Enrollment-wise notification
 def send_to_enrollment(enrollment, title, body, url="/"):
-    token_doc = tokens_col.find_one({"enrollment": enrollment})
-    if not token_doc or not token_doc.get("token"):
-        return {"success_count":0, "failure_count":1, "message":"No token for enrollment"}
-    token = token_doc['token']
-    result = send_fcm_notification(title, body, [token], url)
-    log_notification(title, body, "enrollment", enrollment, {"url": url}, result)
-    return result
+    def tokens():
+        return [t["token"] for t in live_tokens({"enrollment": enrollment})]
+
+    return dispatch(title, body, "enrollment", enrollment, url, tokens)
+
+
+# 2️⃣b Many enrollments at once
+def send_to_enrollments(enrollments, title, body, url="/"):
+    """
+    Bulk enrollment-wise send:
+    one $in token lookup → 500-token multicasts → one insert_many log.
+    Returns {enrollment: "sent" | "failed" | "no_token"} (+ error per failure)
+    """
+    enrollments = list(dict.fromkeys(e for e in enrollments if e))
+    if not enrollments:
+        return {}
+
+    token_of = {
+        d["enrollment"]: d["token"]
+        for d in live_tokens({"enrollment": {"$in": enrollments}})
+        if d.get("token")
+    }
+
+    try:
+        delivered = send_tokens(title, body, list(token_of.values()), url)
+    except Exception as e:
+        print("❌ FCM SEND ERROR:", e)
+        delivered = {t: e for t in token_of.values()}
+
+    statuses = {}
+    logs = []
+    now = datetime.utcnow()
+
+    for e in enrollments:
+        token = token_of.get(e)
+        if not token:
+            statuses[e] = {"status": "no_token"}
+            continue
+
+        error = delivered.get(token)
+        if error is None:
+            statuses[e] = {"status": "sent"}
+        else:
+            statuses[e] = {"status": "failed", "error": str(error)}
+
+        logs.append({
+            "title": title,
+            "body": body,
+            "target_type": "enrollment",
+            "target": e,
+            "data": {"url": url},
+            "success_count": 1 if error is None else 0,
+            "failure_count": 0 if error is None else 1,
+            "timestamp": now
+        })
+
+    if logs:
+        notifications_col.insert_many(logs, ordered=False)
+
+    missing = [e for e, r in statuses.items() if r["status"] == "no_token"]
+    if missing:
+        print(f"ℹ️ No live token for {len(missing)}/{len(enrollments)} enrollments:",
+              ", ".join(missing[:20]) + (" …" if len(missing) > 20 else ""))
+
+    return statuses
+
+
+def queue_to_enrollments(enrollments, title, body, url="/"):
+    """send_to_enrollments() on the worker pool — for producers that don't wait"""
+    enrollments = list(enrollments)
+    if NOTIFY_SYNC:
+        return send_to_enrollments(enrollments, title, body, url)
+
+    job_id = uuid.uuid4().hex[:12]
+
+    def run():
+        try:
+            send_to_enrollments(enrollments, title, body, url)
+        except Exception as e:
+            print(f"❌ Notification job {job_id} failed:", e)
+
+    _job_pool.submit(run)
+    return {"queued": True, "job_id": job_id}
 
 
 # 3️⃣ Class-wise notification
-def send_to_class(student_class, title, body, url="/"):
-    tokens = [t['token'] for t in tokens_col.find({"studentClass": student_class})]
-    result = send_fcm_notification(title, body, tokens, url)
-    log_notification(title, body, "class", student_class, {"url": url}, result)
-    return result
+def send_to_class(student_class=None, title=None, body=None, url="/", class_name=None):
+    student_class = student_class or class_name
+
+    def tokens():
+        return [t['token'] for t in live_tokens({"studentClass": student_class})]
+
+    return dispatch(title, body, "class", student_class, url, tokens)
 
 
 # 4️⃣ Global notification
 def send_global(title, body, url="/"):
-    tokens = [t['token'] for t in tokens_col.find({})]
-    result = send_fcm_notification(title, body, tokens, url)
-    log_notification(title, body, "global", "all", {"url": url}, result)
-    return result
+    def tokens():
+        return [t['token'] for t in live_tokens()]
+
+    return dispatch(title, body, "global", "all", url, tokens)
 
 
 # -------------------- EXPOSED ROUTES --------------------
@@ -166,9 +450,7 @@ def notify_enrollment():
     title = data.get('title')
     body = data.get('body')
     url = data.get('url', "/")
-    results = []
-    for e in enrollments:
-        results.append(send_to_enrollment(e, title, body, url))
+    results = send_to_enrollments(enrollments, title, body, url)
     return jsonify({"success": True, "results": results})
 
 
@@ -204,9 +486,7 @@ def notify_attendance():
     body = data.get('body', "Your attendance has been updated")
     title = data.get('title', "Attendance Update")
     url = data.get('url', "/attendance.html")
-    results = []
-    for e in enrollments:
-        results.append(send_to_enrollment(e, title, body, url))
+    results = send_to_enrollments(enrollments, title, body, url)
     return jsonify({"success": True, "results": results})
 
 
@@ -222,13 +502,10 @@ def notify_marks():
     if not enrollments:
         return jsonify({"success": False, "message": "No enrollments provided"}), 400
 
-    results = []
-    for e in enrollments:
-        try:
-            res = send_to_enrollment(e, title, body, url)
-            results.append({"enrollment": e, "status": "success", "result": res})
-        except Exception as ex:
-            results.append({"enrollment": e, "status": "failed", "error": str(ex)})
+    try:
+        results = send_to_enrollments(enrollments, title, body, url)
+    except Exception as ex:
+        return jsonify({"success": False, "message": str(ex)}), 500
 
     return jsonify({"success": True, "results": results}), 200
 
@@ -354,9 +631,10 @@ def subscribe():
     subscription = data.get('subscription') or data  # data me pura subscription object aa sakta hai
 
     try:
-        tokens_col.update_one(
+        # web-push subscriptions live apart from FCM tokens
+        webpush_col.update_one(
             {'enrollment': enrollment},
-            {'$set': {'token': subscription}},
+            {'$set': {'subscription': subscription, 'updatedAt': datetime.utcnow()}},
             upsert=True
         )
         return jsonify({"success": True, "message": "Subscription saved"})
@@ -365,6 +643,37 @@ def subscribe():
 
 
 # 📥 Fetch notifications for a student
+def inbox_query(enrollment, student_class):
+    return {
+        "$or": [
+            {"target_type": "global"},
+            {"target_type": "class", "target": student_class},
+            {"target_type": "enrollment", "target": enrollment}
+        ]
+    }
+
+
+def parse_before(before):
+    """before=<iso timestamp>,<id> → keyset condition"""
+    ts, _, oid = before.partition(",")
+    ts = datetime.fromisoformat(ts)
+    oid = ObjectId(oid)
+    return {
+        "$or": [
+            {"timestamp": {"$lt": ts}},
+            {"timestamp": ts, "_id": {"$lt": oid}}
+        ]
+    }
+
+
+def unread_count(enrollment, student_class):
+    read = reads_col.find_one({"enrollment": enrollment}, {"_id": 0, "lastReadAt": 1})
+    query = inbox_query(enrollment, student_class)
+    if read and read.get("lastReadAt"):
+        query = {"$and": [query, {"timestamp": {"$gt": read["lastReadAt"]}}]}
+    return notifications_col.count_documents(query, limit=UNREAD_CAP + 1)
+
+
 @notifications_bp.route('/api/notifications', methods=['GET'])
 def get_notifications():
     enrollment = request.args.get('enrollment')
@@ -373,20 +682,27 @@ def get_notifications():
     if not enrollment:
         return jsonify({"success": False, "message": "Enrollment required"}), 400
 
-    query = {
-        "$or": [
-            {"target_type": "global"},
-            {"target_type": "class", "target": student_class},
-            {"target_type": "enrollment", "target": enrollment}
-        ]
-    }
+    try:
+        limit = min(max(int(request.args.get('limit', INBOX_PAGE_SIZE)), 1), INBOX_PAGE_SIZE)
+        query = inbox_query(enrollment, student_class)
+        before = request.args.get('before')
+        if before:
+            query = {"$and": [query, parse_before(before)]}
+    except Exception:
+        return jsonify({"success": False, "message": "Invalid limit or before cursor"}), 400
 
     notifications = list(
         notifications_col.find(query)
-        .sort("timestamp", -1)
-        .limit(100)
+        .sort([("timestamp", -1), ("_id", -1)])
+        .limit(limit)
     )
 
+    next_before = None
+    if len(notifications) == limit:
+        last = notifications[-1]
+        if isinstance(last.get("timestamp"), datetime):
+            next_before = f'{last["timestamp"].isoformat()},{last["_id"]}'
+
     for n in notifications:
         n["_id"] = str(n["_id"])
         ts = n.get("timestamp")
@@ -397,14 +713,47 @@ def get_notifications():
 
     return jsonify({
         "success": True,
-        "notifications": notifications
+        "notifications": notifications,
+        "next_before": next_before
+    })
+
+
+# 🔴 Unread badge
+@notifications_bp.route('/api/notifications/unread-count', methods=['GET'])
+def get_unread_count():
+    enrollment = request.args.get('enrollment')
+    student_class = request.args.get('class')
+
+    if not enrollment:
+        return jsonify({"success": False, "message": "Enrollment required"}), 400
+
+    count = unread_count(enrollment, student_class)
+    return jsonify({
+        "success": True,
+        "unread_count": min(count, UNREAD_CAP),
+        "more": count > UNREAD_CAP
     })
 
 
+# ✅ Mark inbox as read (moves the watermark)
+@notifications_bp.route('/api/notifications/mark-read', methods=['POST'])
+def mark_notifications_read():
+    data = request.json or {}
+    enrollment = data.get('enrollment')
+
+    if not enrollment:
+        return jsonify({"success": False, "message": "Enrollment required"}), 400
+
+    reads_col.update_one(
+        {"enrollment": enrollment},
+        {"$set": {"lastReadAt": datetime.utcnow()}},
+        upsert=True
+    )
+    return jsonify({"success": True})
+
+
 @notifications_bp.route("/api/notifications/<id>", methods=["DELETE"])
 def delete_notification(id):
-    from bson import ObjectId
-
     result = db.notifications.delete_one({
         "_id": ObjectId(id)
     })
@@ -1,32 +1,22 @@
-from pymongo import MongoClient
-from firebase_admin import messaging
-import os
+from db import get_db
+from routes.notifications import send_fcm_notification, live_tokens
 
-client = MongoClient(os.getenv("MONGO_COLLEGE_DB_URI"))
-db = client["college_db"]
+db = get_db("college_db")
 
 tokens_col = db["fcm_tokens"]
 
 def push_notification(title, body, url, user_filter=None):
     query = user_filter or {}
 
-    tokens = [t.get("token") for t in tokens_col.find(query) if t.get("token")]
+    tokens = [t["token"] for t in live_tokens(query)]
 
     if not tokens:
         return {"status": "no_tokens"}
 
-    message = messaging.MulticastMessage(
-        notification=messaging.Notification(
-            title=title,
-            body=body
-        ),
-        data={"url": str(url)},
-        tokens=tokens
-    )
-
-    response = messaging.send_multicast(message)
+    # 500-token batches + retry handled by the shared sender
+    result = send_fcm_notification(title, body, tokens, url)
 
     return {
-        "success": response.success_count,
-        "failure": response.failure_count
+        "success": result["success_count"],
+        "failure": result["failure_count"]
     }
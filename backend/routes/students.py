@@ -1,6 +1,6 @@
 from flask import Blueprint, request, jsonify
 from flask_cors import CORS
-from pymongo import MongoClient
+from db import get_db
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import os
@@ -14,9 +14,8 @@ MONGO_URL = os.getenv("MONGO_URL")
 if not MONGO_URL:
     raise Exception("MONGO_URL environment variable missing!")
 
-client = MongoClient(MONGO_URL)
-classes_db = client["classes"]         # collections for each class-section
-users_db = client["users"]             # user login DB
+classes_db = get_db("classes")         # collections for each class-section
+users_db = get_db("users")             # user login DB
 students_collection = users_db["students"]  # explicit collection reference
 
 # Helper: convert frontend dropdown "1-A" -> collection name
@@ -0,0 +1,29 @@
+from flask import Blueprint, jsonify, request
+from flask_cors import cross_origin
+
+import uploads
+from storage import get_storage
+
+uploads_bp = Blueprint("uploads_bp", __name__, url_prefix="/api/uploads")
+
+
+# ----------------- UPLOAD JOB STATUS -----------------
+@uploads_bp.route("/<job_id>", methods=["GET"])
+@cross_origin()
+def upload_status(job_id):
+    job = uploads.status(job_id)
+    if not job:
+        return jsonify({"success": False, "message": "Job not found"}), 404
+
+    job["jobId"] = job.pop("_id")
+    return jsonify({"success": True, "job": job}), 200
+
+
+# ----------------- LOCAL STORAGE FILES (STORAGE_BACKEND=local) -----------------
+@uploads_bp.route("/files/<path:key>", methods=["GET"])
+@cross_origin()
+def serve_stored_file(key):
+    try:
+        return get_storage("local").stream(key, download=bool(request.args.get("download")))
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid path"}), 400
@@ -0,0 +1,169 @@
+# storage.py
+# One interface for file storage, whatever is behind it.
+#
+#   store = get_storage()                 # STORAGE_BACKEND=cloudinary (default) | local
+#   result = store.put(path_or_file, {"folder": "notes", "public_id": "note_N1", "resource_type": "raw"})
+#   store.url(key) / store.get(key) / store.stream(key) / store.delete(key)
+#
+# put() returns the same shape for every driver:
+#   {"secure_url", "public_id" (= key), "resource_type", "bytes", "storage"}
+# so records and upload jobs don't care where the bytes went.
+#
+# LocalStorage serves files with send_file(conditional=True): Range requests
+# get 206 partial content, and full responses go out through the WSGI
+# file_wrapper (sendfile under gunicorn) instead of being read into Python.
+import os
+import shutil
+import uuid
+
+import cloudinary.uploader
+import cloudinary.utils
+import requests
+from flask import redirect, send_file, abort
+from werkzeug.security import safe_join
+
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "cloudinary")
+STORAGE_LOCAL_DIR = os.getenv("STORAGE_LOCAL_DIR", os.path.join(os.path.dirname(__file__), "uploads", "files"))
+STORAGE_LOCAL_URL = os.getenv("STORAGE_LOCAL_URL", "/api/uploads/files")
+STORAGE_MAX_AGE = int(os.getenv("STORAGE_MAX_AGE", 3600))     # seconds, local files
+CHUNK_BYTES = 1024 * 1024
+LARGE_UPLOAD_BYTES = int(os.getenv("UPLOAD_CHUNK_MB", 6)) * 1024 * 1024   # Cloudinary chunk size (min 5)
+
+
+def _size(source):
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    return None
+
+
+# -------------------- CLOUDINARY --------------------
+class CloudinaryStorage:
+    name = "cloudinary"
+
+    def put(self, source, options):
+        size = _size(source)
+        if size is not None and size > LARGE_UPLOAD_BYTES:
+            result = cloudinary.uploader.upload_large(source, chunk_size=LARGE_UPLOAD_BYTES, **options)
+        else:
+            result = cloudinary.uploader.upload(source, **options)
+        return {
+            "secure_url": result.get("secure_url"),
+            "public_id": result.get("public_id"),
+            "resource_type": result.get("resource_type"),
+            "bytes": result.get("bytes"),
+            "storage": self.name,
+        }
+
+    def url(self, key, resource_type="raw", download=False):
+        url, _ = cloudinary.utils.cloudinary_url(key, resource_type=resource_type, secure=True)
+        if download:
+            url += ("&" if "?" in url else "?") + "fl_attachment=true"
+        return url
+
+    def get(self, key, resource_type="raw"):
+        resp = requests.get(self.url(key, resource_type), timeout=60)
+        resp.raise_for_status()
+        return resp.content
+
+    def stream(self, key, resource_type="raw", download=False):
+        return redirect(self.url(key, resource_type, download))
+
+    def delete(self, key, resource_type="raw"):
+        result = cloudinary.uploader.destroy(key, resource_type=resource_type or "image", invalidate=True)
+        return result.get("result") == "ok"
+
+
+# -------------------- LOCAL DISK --------------------
+class LocalStorage:
+    name = "local"
+
+    def __init__(self, root=STORAGE_LOCAL_DIR, base_url=STORAGE_LOCAL_URL):
+        self.root = root
+        self.base_url = base_url.rstrip("/")
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, key):
+        path = safe_join(self.root, key)
+        if path is None:
+            raise ValueError(f"Invalid storage key: {key}")
+        return path
+
+    def _key_for(self, source, options):
+        src = source if isinstance(source, str) else getattr(source, "filename", "") or ""
+        ext = os.path.splitext(src)[1]
+        name = options.get("public_id")
+        if not name:
+            name = uuid.uuid4().hex + ext
+        elif not os.path.splitext(name)[1]:
+            name += ext      # keep .pdf etc. so the file is served with the right type
+        folder = options.get("folder")
+        key = f"{folder.strip('/')}/{name}" if folder else name
+        if not options.get("overwrite", True) and os.path.exists(self.path(key)):
+            root, ext = os.path.splitext(key)
+            key = f"{root}_{uuid.uuid4().hex[:6]}{ext}"
+        return key
+
+    def put(self, source, options):
+        key = self._key_for(source, options)
+        dest = self.path(key)
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+
+        tmp = f"{dest}.{uuid.uuid4().hex}.part"
+        if isinstance(source, (str, os.PathLike)):
+            shutil.copyfile(source, tmp)
+        else:
+            stream = getattr(source, "stream", source)
+            with open(tmp, "wb") as out:
+                shutil.copyfileobj(stream, out, CHUNK_BYTES)
+        os.replace(tmp, dest)     # readers never see a half-written file
+
+        return {
+            "secure_url": self.url(key),
+            "public_id": key,
+            "resource_type": options.get("resource_type") or "raw",
+            "bytes": os.path.getsize(dest),
+            "storage": self.name,
+        }
+
+    def url(self, key, resource_type=None, download=False):
+        return f"{self.base_url}/{key}" + ("?download=1" if download else "")
+
+    def get(self, key, resource_type=None):
+        with open(self.path(key), "rb") as f:
+            return f.read()
+
+    def stream(self, key, resource_type=None, download=False):
+        path = self.path(key)
+        if not os.path.isfile(path):
+            abort(404)
+        return send_file(
+            path,
+            as_attachment=download,
+            conditional=True,          # ETag / If-Modified-Since / Range → 206
+            max_age=STORAGE_MAX_AGE
+        )
+
+    def delete(self, key, resource_type=None):
+        try:
+            os.remove(self.path(key))
+            return True
+        except FileNotFoundError:
+            return False
+
+
+# -------------------- REGISTRY --------------------
+DRIVERS = {
+    "cloudinary": CloudinaryStorage,
+    "local": LocalStorage,
+}
+_instances = {}
+
+
+def get_storage(name=None):
+    """Driver by name (default STORAGE_BACKEND), one instance per driver"""
+    name = name or STORAGE_BACKEND
+    if name not in _instances:
+        if name not in DRIVERS:
+            raise ValueError(f"Unknown storage backend: {name}")
+        _instances[name] = DRIVERS[name]()
+    return _instances[name]
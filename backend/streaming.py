@@ -0,0 +1,118 @@
+# streaming.py
+# Stream large Mongo result sets as JSON without building a Python list.
+#
+#   return stream_json(db.fine.find(), "fines")
+#
+# → {"success": true, "fines": [ ...one document at a time... ], "count": N}
+# or, with ?format=ndjson (or Accept: application/x-ndjson), one document per
+# line. ObjectId / datetime are encoded inline.
+#
+# The first batch is fetched before the response starts, so a bad query or an
+# unreachable server still raises in the view (→ its normal 500). If the
+# cursor fails later, the 200 is already on the wire: the body is closed with
+# "success": false + "error" (NDJSON: a final {"success": false, ...} line)
+# so clients can tell a truncated list from a complete one.
+import json
+from datetime import datetime, date
+
+from bson import ObjectId
+from flask import Response, request
+
+STREAM_BATCH_SIZE = 500     # documents per Mongo getMore
+CHUNK_BYTES = 64 * 1024     # flush to the client roughly this often
+STREAM_ERROR = {"success": False, "error": "Stream interrupted"}
+
+_END = object()
+
+
+def encode_default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    return str(value)
+
+
+def dumps(doc):
+    return json.dumps(doc, default=encode_default, ensure_ascii=False, separators=(",", ":"))
+
+
+def wants_ndjson():
+    return (
+        request.args.get("format") == "ndjson"
+        or "application/x-ndjson" in request.headers.get("Accept", "")
+    )
+
+
+def _batched(cursor):
+    if hasattr(cursor, "batch_size"):
+        cursor = cursor.batch_size(STREAM_BATCH_SIZE)
+    return cursor
+
+
+def _primed(cursor):
+    """Run the first batch now; errors before any output raise in the caller"""
+    it = iter(cursor)
+    first = next(it, _END)
+
+    def docs():
+        if first is _END:
+            return
+        yield first
+        yield from it
+    return docs()
+
+
+def _buffered(pieces):
+    """Group small pieces into ~CHUNK_BYTES writes"""
+    buf = []
+    size = 0
+    for piece in pieces:
+        buf.append(piece)
+        size += len(piece)
+        if size >= CHUNK_BYTES:
+            yield "".join(buf)
+            buf = []
+            size = 0
+    if buf:
+        yield "".join(buf)
+
+
+def stream_json(cursor, key, transform=None, extra=None, count=True, tail=None):
+    """
+    Stream a cursor as {"success": true, <key>: [...]} (or NDJSON).
+    transform: optional per-document function (e.g. serialize)
+    extra: additional top-level fields written before the array
+    tail: callable → fields written after the array (e.g. next_cursor)
+    """
+    docs = _primed(_batched(cursor))
+    transform = transform or (lambda d: d)
+
+    if wants_ndjson():
+        def ndjson():
+            try:
+                for doc in docs:
+                    yield dumps(transform(doc)) + "\n"
+            except Exception as e:
+                print(f"❌ Stream of {key} interrupted:", e)
+                yield dumps(STREAM_ERROR) + "\n"
+        return Response(_buffered(ndjson()), mimetype="application/x-ndjson")
+
+    head = {"success": True, **(extra or {})}
+
+    def body():
+        yield dumps(head)[:-1] + f',{json.dumps(key)}:['
+        n = 0
+        try:
+            for doc in docs:
+                yield ("," if n else "") + dumps(transform(doc))
+                n += 1
+            trailer = {"count": n} if count else {}
+            if tail:
+                trailer.update(tail())
+        except Exception as e:
+            print(f"❌ Stream of {key} interrupted:", e)
+            trailer = {"count": n, **STREAM_ERROR}   # later "success" wins when parsed
+        yield "]" + "".join(f",{json.dumps(k)}:{dumps(v)}" for k, v in trailer.items()) + "}"
+
+    return Response(_buffered(body()), mimetype="application/json")
@@ -1,22 +1,28 @@
 # timetables.py
 import os
-from flask import Blueprint, request, jsonify, send_from_directory, current_app
+from flask import Blueprint, request, jsonify, current_app
 from werkzeug.utils import secure_filename
 from db import db                     # your pymongo db object
-from utils import generate_id         # you already use this pattern
+from utils import generate_id, norm_key  # you already use this pattern
+from versions import conditional, bump
+from uploads import max_upload, save_hashed
+from storage import LocalStorage
 
 timetables_bp = Blueprint("timetables_bp", __name__, url_prefix="/api/timetables")
 
 # Config
 UPLOAD_DIR = os.path.join(os.path.dirname(__file__), "uploads", "timetables")
 ALLOWED_EXTENSIONS = {"pdf"}
+MAX_TIMETABLE_MB = int(os.getenv("MAX_TIMETABLE_MB", 10))
 os.makedirs(UPLOAD_DIR, exist_ok=True)
+local_files = LocalStorage(UPLOAD_DIR, base_url="/api/timetables/files")
 
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
 # POST /api/timetables  -> upload a pdf with form-data: class, file
 @timetables_bp.route('', methods=['POST'])
+@max_upload(MAX_TIMETABLE_MB)
 def upload_timetable():
     if 'file' not in request.files:
         return jsonify({"success": False, "message": "No file part"}), 400
@@ -37,16 +43,20 @@ def upload_timetable():
     save_path = os.path.join(UPLOAD_DIR, stored_filename)
 
     try:
-        file.save(save_path)
+        sha256, size = save_hashed(file, save_path)
         # use normalized class_name here
         record = {
             "timetableId": timetable_id,
             "class": class_name,   # <- fix applied
+            "class_norm": norm_key(class_name),
             "originalFilename": filename,
             "storedFilename": stored_filename,
+            "sha256": sha256,
+            "bytes": size,
             "uploadedAt": __import__("datetime").datetime.utcnow().isoformat()
         }
         db.timetables.insert_one(record)
+        bump("timetables")
         return jsonify({"success": True, "message": "Timetable uploaded", "timetableId": timetable_id}), 201
 
     except Exception as e:
@@ -56,15 +66,15 @@ def upload_timetable():
 
 # GET /api/timetables?class=1A -> list timetables, optional class filter
 @timetables_bp.route('', methods=['GET'])
+@conditional("timetables")
 def list_timetables():
     class_q = request.args.get("class")
     query = {}
     try:
         if class_q:
             # ✅ normalize input like "1-a", "1 - A", " 1A ", etc.
-            normalized = class_q.replace(" ", "").replace("-", "").upper()
-            # use regex to allow flexible match (case-insensitive)
-            query["class"] = {"$regex": f"^{normalized}$", "$options": "i"}
+            # exact match on the stored normalized key (indexed)
+            query["class_norm"] = norm_key(class_q)
 
         docs = list(db.timetables.find(query, {"_id": 0}))
         return jsonify({"success": True, "timetables": docs}), 200
@@ -81,7 +91,7 @@ def serve_timetable_file(timetableId):
     if not stored:
         return jsonify({"success": False, "message": "File missing"}), 404
     try:
-        return send_from_directory(UPLOAD_DIR, stored, as_attachment=False)
+        return local_files.stream(stored)      # Range / conditional aware
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
 
@@ -94,10 +104,9 @@ def delete_timetable(timetableId):
     stored = rec.get("storedFilename")
     try:
         db.timetables.delete_one({"timetableId": timetableId})
+        bump("timetables")
         if stored:
-            fp = os.path.join(UPLOAD_DIR, stored)
-            if os.path.exists(fp):
-                os.remove(fp)
+            local_files.delete(stored)
         return jsonify({"success": True, "message": "Timetable deleted"}), 200
     except Exception as e:
         return jsonify({"success": False, "message": str(e)}), 500
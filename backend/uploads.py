@@ -0,0 +1,432 @@
+# uploads.py
+# Background Cloudinary uploads with durable job tracking.
+#
+#   job_id = submit(request.files["pdf"], {"resource_type": "raw", "folder": "notes"},
+#                   target=target("notes", {"noteId": note_id}, file_url="secure_url"))
+#
+# submit() spools the incoming file to UPLOAD_SPOOL_DIR (on persistent disk, so
+# a restart doesn't lose it) and records a job in
+# `upload_jobs` before returning, so the request is done as soon as the bytes
+# are on local disk. A bounded worker pool uploads the spooled file (with
+# retries + backoff), then $sets the result fields on the target document and
+# removes the spool file. GET /api/uploads/<job_id> reports progress.
+#
+# Everything the completion needs lives in the job, so it survives recover():
+# the target collection's cache version is bumped, the file the record pointed
+# at before is released, if the record was deleted while the upload was
+# pending the new file is given back instead of leaking, and an `announce`
+# notification goes out once the file is live.
+#
+# submit(..., dedup=True) looks the SHA-256 up in `assets` first: identical
+# bytes reuse the stored asset without any transfer, and the result carries
+# an asset_id the record should keep so it can assets.release() it later.
+#
+# upload_many() is the synchronous counterpart for requests that need the
+# URLs before answering (form submissions, form attachments): files go up
+# side by side on a bounded pool and either all of them land or none are
+# kept (undo() gives them back if the caller fails afterwards).
+#
+# Memory stays flat for any file size: @max_upload(mb) caps the request body
+# per route (413 before anything is buffered), the spool copy reads 1 MB
+# chunks and hashes them (SHA-256) on the way, and files above
+# UPLOAD_CHUNK_MB go to Cloudinary with chunked upload_large.
+#
+# The bytes go wherever storage.get_storage() points (Cloudinary by default,
+# STORAGE_BACKEND=local for disk); results always have the same shape.
+#
+# UPLOAD_SYNC=1 runs the upload inline (scripts / debugging).
+# recover() requeues jobs whose worker died mid-upload; app startup runs it,
+# and so does `python uploads.py recover`.
+import os
+import sys
+import hashlib
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from functools import wraps
+
+import cloudinary
+from flask import request, jsonify
+from pymongo import ReturnDocument
+from werkzeug.exceptions import RequestEntityTooLarge
+from werkzeug.utils import secure_filename
+
+import assets
+from cache import invalidate
+from db import get_db
+from routes.notifications import send_global
+from storage import get_storage
+
+jobs_collection = get_db("college_db")["upload_jobs"]
+
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR", os.path.join(os.path.dirname(__file__), "uploads", "spool"))
+UPLOAD_MAX_RETRIES = int(os.getenv("UPLOAD_MAX_RETRIES", 3))
+UPLOAD_RETRY_BACKOFF = float(os.getenv("UPLOAD_RETRY_BACKOFF", 1.0))   # seconds, doubles per retry
+UPLOAD_STALE_MINUTES = int(os.getenv("UPLOAD_STALE_MINUTES", 15))
+UPLOAD_SYNC = os.getenv("UPLOAD_SYNC") == "1"
+COPY_CHUNK_BYTES = 1024 * 1024
+
+os.makedirs(UPLOAD_SPOOL_DIR, exist_ok=True)
+
+_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("UPLOAD_WORKERS", 2)),
+    thread_name_prefix="upload"
+)
+_fanout_pool = ThreadPoolExecutor(
+    max_workers=int(os.getenv("UPLOAD_FANOUT_WORKERS", 4)),
+    thread_name_prefix="upload-fanout"
+)
+
+
+class UploadError(Exception):
+    def __init__(self, name, error):
+        super().__init__(f"{name}: {error}")
+        self.name = name
+        self.error = error
+
+
+# -------------------- TARGETS --------------------
+def target(collection, query, db="college_db", **fields):
+    """
+    Where the result goes: `fields` maps document field → upload result key,
+    e.g. target("notes", {"noteId": "N1"}, file_url="secure_url")
+    """
+    # stored as pairs — field paths like "pdfs.0" can't be document keys
+    return {"db": db, "collection": collection, "query": query, "fields": list(fields.items())}
+
+
+def _apply(tgt, result, status, error=None):
+    """$set the outcome on the target → False if the target record is gone"""
+    if not tgt:
+        return True
+    update = {"uploadStatus": status}
+    if status == "done":
+        update.update({field: result.get(key) for field, key in tgt["fields"]})
+    if error:
+        update["uploadError"] = error
+
+    coll = get_db(tgt["db"])[tgt["collection"]]
+    before = coll.find_one_and_update(tgt["query"], {"$set": update}, return_document=ReturnDocument.BEFORE)
+    invalidate(tgt["collection"])
+    if before is None:
+        return False
+    if status == "done":
+        _release_replaced(tgt, before, result)
+    return True
+
+
+def _release_replaced(tgt, before, result):
+    """Let go of the file the record pointed at before this upload"""
+    field_of = {key: field for field, key in tgt["fields"]}
+    old_aid = before.get(field_of["asset_id"]) if "asset_id" in field_of else None
+    old_pid = before.get(field_of["public_id"]) if "public_id" in field_of else None
+    try:
+        if old_aid:
+            # also right when the same bytes came back: a new reference was taken
+            assets.release(old_aid)
+        elif old_pid and old_pid != result.get("public_id"):
+            # legacy record from before assets — its file sits in Cloudinary
+            _discard({"public_id": old_pid, "resource_type": result.get("resource_type"), "storage": "cloudinary"})
+    except Exception as e:
+        print("⚠️ Release of replaced file failed:", e)
+
+
+# -------------------- LIMITS --------------------
+def max_upload(megabytes):
+    """Per-route request body cap; oversize uploads get a JSON 413"""
+    limit = int(megabytes * 1024 * 1024)
+
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            request.max_content_length = limit
+            if request.content_length and request.content_length > limit:
+                return _too_large(megabytes)
+            try:
+                return f(*args, **kwargs)
+            except RequestEntityTooLarge:
+                return _too_large(megabytes)
+        return wrapper
+    return decorator
+
+
+def _too_large(megabytes):
+    return jsonify({"success": False, "message": f"File too large (max {megabytes} MB)"}), 413
+
+
+# -------------------- SPOOL --------------------
+def save_hashed(file, path):
+    """Copy a FileStorage to `path` in fixed-size chunks → (sha256 hex, bytes)"""
+    digest = hashlib.sha256()
+    size = 0
+    stream = file.stream
+    with open(path, "wb") as out:
+        while True:
+            chunk = stream.read(COPY_CHUNK_BYTES)
+            if not chunk:
+                break
+            digest.update(chunk)
+            out.write(chunk)
+            size += len(chunk)
+    return digest.hexdigest(), size
+
+
+def spool(file):
+    """Stream an uploaded FileStorage to local disk → (path, sha256, bytes)"""
+    name = secure_filename(file.filename or "") or "upload"
+    path = os.path.join(UPLOAD_SPOOL_DIR, f"{uuid.uuid4().hex}_{name}")
+    sha256, size = save_hashed(file, path)
+    return path, sha256, size
+
+
+def _send(path, options):
+    """Hand the spooled file to the storage driver (chunked when large)"""
+    return get_storage().put(path, options)
+
+
+def _discard(result):
+    try:
+        get_storage(result.get("storage")).delete(result["public_id"], result.get("resource_type"))
+    except Exception as e:
+        print(f"⚠️ Cleanup of {result['public_id']} failed:", e)
+
+
+def _adopt(aid, result):
+    """Register a fresh upload as asset `aid` → the result to keep"""
+    stored = assets.register(aid, result)
+    if stored["public_id"] != result["public_id"]:
+        # same bytes finished uploading elsewhere first — keep theirs
+        _discard(result)
+        result.update(stored)
+    result["asset_id"] = aid
+    return result
+
+
+# -------------------- WORKER --------------------
+def _claim(job_id):
+    return jobs_collection.find_one_and_update(
+        {"_id": job_id, "status": "queued"},
+        {"$set": {"status": "uploading", "updatedAt": datetime.utcnow()}},
+        return_document=ReturnDocument.AFTER
+    )
+
+
+def _run(job_id):
+    job = _claim(job_id)
+    if not job:
+        return   # already taken by another worker / recover run
+
+    path = job["path"]
+    error = None
+    started = time.monotonic()
+    for attempt in range(UPLOAD_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(UPLOAD_RETRY_BACKOFF * (2 ** (attempt - 1)))
+        try:
+            result = _send(path, job["options"])
+            break
+        except Exception as e:
+            error = str(e)
+            jobs_collection.update_one(
+                {"_id": job_id},
+                {"$set": {"attempts": attempt + 1, "error": error, "updatedAt": datetime.utcnow()}}
+            )
+            print(f"⚠️ Upload {job_id} attempt {attempt + 1} failed:", e)
+    else:
+        jobs_collection.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "failed", "updatedAt": datetime.utcnow()}}
+        )
+        _apply(job.get("target"), None, "failed", error)
+        _cleanup(path)
+        return
+
+    result["seconds"] = round(time.monotonic() - started, 3)
+
+    if job.get("assetId"):
+        result = _adopt(job["assetId"], result)
+
+    _finish(job, result)
+
+
+def _finish(job, result):
+    job_id = job["_id"]
+    jobs_collection.update_one(
+        {"_id": job_id},
+        {"$set": {"status": "done", "result": result, "error": None, "updatedAt": datetime.utcnow()}}
+    )
+    live = _apply(job.get("target"), result, "done")
+    if not live:
+        # the record was deleted while the upload was pending
+        print(f"🧹 Upload {job_id} landed after its record was deleted — releasing it")
+        undo([result])
+    _cleanup(job["path"])
+
+    if live and job.get("announce"):
+        try:
+            send_global(**job["announce"])
+        except Exception:
+            print(f"⚠️ Upload {job_id} announcement failed:")
+            traceback.print_exc()
+
+
+def _cleanup(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _dispatch(job_id):
+    if UPLOAD_SYNC:
+        _run(job_id)
+    else:
+        _pool.submit(_run, job_id)
+
+
+# -------------------- API --------------------
+def submit(file, options, target=None, announce=None, dedup=False):
+    """
+    Spool `file`, record the job and queue the upload → job id.
+    options: Cloudinary-style upload options (folder, public_id, resource_type, ...)
+    announce: {title, body, url} sent to everyone (send_global) once the file
+              is live — stored on the job, so a recovered job still sends it
+    dedup: reuse an identical stored asset (don't combine with a fixed,
+           overwritten public_id)
+    """
+    path, sha256, size = spool(file)
+    job_id = f"U-{uuid.uuid4().hex}"
+    now = datetime.utcnow()
+    aid = assets.asset_id(sha256, options.get("resource_type")) if dedup else None
+    jobs_collection.insert_one({
+        "_id": job_id,
+        "status": "queued",
+        "path": path,
+        "filename": file.filename,
+        "sha256": sha256,
+        "bytes": size,
+        "options": options,
+        "target": target,
+        "announce": announce,
+        "assetId": aid,
+        "attempts": 0,
+        "error": None,
+        "result": None,
+        "createdAt": now,
+        "updatedAt": now
+    })
+    if target:
+        _apply(target, None, "pending")
+
+    existing = assets.acquire(aid) if aid else None
+    if existing:
+        job = _claim(job_id)
+        _finish(job, {**existing, "asset_id": aid, "seconds": 0, "deduplicated": True})
+    else:
+        _dispatch(job_id)
+    return job_id
+
+
+def _upload_timed(file, options, dedup=False):
+    started = time.monotonic()
+    if not dedup:
+        result = get_storage().put(file, options)
+        return result, round(time.monotonic() - started, 3)
+
+    path, sha256, _ = spool(file)
+    try:
+        aid = assets.asset_id(sha256, options.get("resource_type"))
+        existing = assets.acquire(aid)
+        if existing:
+            result = {**existing, "asset_id": aid, "deduplicated": True}
+        else:
+            result = _adopt(aid, get_storage().put(path, options))
+    finally:
+        _cleanup(path)
+    return result, round(time.monotonic() - started, 3)
+
+
+def undo(results):
+    """Give back uploads that won't be kept (asset references or raw files)"""
+    for r in results:
+        if r.get("asset_id"):
+            try:
+                assets.release(r["asset_id"])
+            except Exception as e:
+                print(f"⚠️ Release of {r['asset_id']} failed:", e)
+        else:
+            _discard(r)
+
+
+def upload_many(files, options, dedup=False):
+    """
+    Upload {name: FileStorage} concurrently → {name: {secure_url, public_id,
+    resource_type, seconds[, asset_id]}}. If any file fails, the ones that
+    made it are given back again and UploadError is raised.
+    dedup: reuse identical stored assets, as submit(dedup=True)
+    """
+    futures = {
+        name: _fanout_pool.submit(_upload_timed, f, options, dedup)
+        for name, f in files.items()
+    }
+
+    results, failed = {}, None
+    for name, future in futures.items():
+        try:
+            result, seconds = future.result()
+            results[name] = {**result, "seconds": seconds}
+        except Exception as e:
+            failed = failed or UploadError(name, e)
+
+    if failed:
+        undo(results.values())
+        raise failed
+
+    return results
+
+
+def status(job_id):
+    return jobs_collection.find_one(
+        {"_id": job_id},
+        {"_id": 1, "status": 1, "filename": 1, "bytes": 1, "sha256": 1, "attempts": 1, "error": 1,
+         "result": 1, "createdAt": 1, "updatedAt": 1}
+    )
+
+
+def recover():
+    """
+    Requeue jobs left uploading/queued by a dead worker (spool file still on
+    disk) → number requeued. Each stale job is reset with a compare-and-set on
+    its updatedAt, so workers starting together don't run it twice.
+    """
+    stale = datetime.utcnow() - timedelta(minutes=UPLOAD_STALE_MINUTES)
+    count = 0
+    for job in jobs_collection.find({"status": {"$in": ["queued", "uploading"]}, "updatedAt": {"$lt": stale}}):
+        now = datetime.utcnow()
+        mine = {"_id": job["_id"], "status": job["status"], "updatedAt": job["updatedAt"]}
+        if not os.path.exists(job["path"]):
+            if jobs_collection.update_one(
+                mine, {"$set": {"status": "failed", "error": "spool file missing", "updatedAt": now}}
+            ).modified_count:
+                _apply(job.get("target"), None, "failed", "spool file missing")
+            continue
+        if jobs_collection.update_one(mine, {"$set": {"status": "queued", "updatedAt": now}}).modified_count:
+            _dispatch(job["_id"])
+            count += 1
+    return count
+
+
+if __name__ == "__main__":
+    if len(sys.argv) > 1 and sys.argv[1] == "recover":
+        cloudinary.config(
+            cloud_name=os.getenv("CLOUDINARY_CLOUD_NAME"),
+            api_key=os.getenv("CLOUDINARY_API_KEY"),
+            api_secret=os.getenv("CLOUDINARY_API_SECRET"),
+            secure=True
+        )
+        print(f"✅ Requeued {recover()} upload jobs")
+    else:
+        print("Usage: python uploads.py recover")
+        sys.exit(2)
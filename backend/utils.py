@@ -1,3 +1,4 @@
+import re
 import uuid
 from datetime import datetime
 
@@ -6,3 +7,15 @@ def generate_id(prefix="ID"):
 
 def current_date():
     return datetime.utcnow().isoformat()
+
+def norm_key(value):
+    """Canonical lookup key: "2nd year cse-2 " -> "2NDYEARCSE2" """
+    if not value:
+        return ""
+    return re.sub(r"[^A-Z0-9]", "", str(value).upper())
+
+def norm_enrollment(value):
+    """Enrollment as stored: " 0827cs21 " -> "0827CS21" """
+    if value is None:
+        return ""
+    return str(value).strip().upper()
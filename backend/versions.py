@@ -0,0 +1,113 @@
+# versions.py
+# Conditional GET (ETag / Last-Modified) driven by per-collection change counters.
+#
+#   @conditional("fines")   → on GET, answer If-None-Match / If-Modified-Since
+#                             with 304 before the view runs (no document query)
+#   bump("fines")           → call after every write to that collection
+#
+# Counters live in `collection_versions` ({_id: name, version, updatedAt}) so
+# every worker agrees on them; checking one is a single _id lookup, done at
+# most once per request (cache.py keys its entries on the same counters).
+import zlib
+from datetime import timezone
+from functools import wraps
+
+from flask import request, make_response, Response, g, has_request_context
+
+from db import db
+from streaming import wants_ndjson
+
+versions_col = db["collection_versions"]
+
+
+def _seen():
+    """Counters already read in this request ({} outside one)"""
+    if not has_request_context():
+        return {}
+    if "_versions" not in g:
+        g._versions = {}
+    return g._versions
+
+
+def bump(*names):
+    """Record that these collections changed"""
+    seen = _seen()
+    for name in names:
+        seen.pop(name, None)
+        try:
+            versions_col.update_one(
+                {"_id": name},
+                {"$inc": {"version": 1}, "$currentDate": {"updatedAt": True}},
+                upsert=True
+            )
+        except Exception as e:
+            print(f"⚠️ Version bump failed for {name}:", e)
+
+
+def current(names):
+    """(version tuple, newest updatedAt) for a set of collections"""
+    seen = _seen()
+    missing = [n for n in names if n not in seen]
+    if missing:
+        docs = {d["_id"]: d for d in versions_col.find({"_id": {"$in": missing}})}
+        for n in missing:
+            seen[n] = docs.get(n, {})
+
+    versions = tuple(seen[n].get("version", 0) for n in names)
+    stamps = [seen[n]["updatedAt"] for n in names if seen[n].get("updatedAt")]
+    return versions, (max(stamps) if stamps else None)
+
+
+def version(name):
+    """Current counter of one collection"""
+    return current((name,))[0][0]
+
+
+def _validators(names):
+    versions, updated = current(names)
+    query = "&".join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+    url_crc = zlib.crc32(f"{request.path}?{query}".encode()) & 0xffffffff
+    etag = "-".join(f"{n}.{v}" for n, v in zip(names, versions)) + f"-{url_crc:08x}"
+    if wants_ndjson():
+        etag += "-nd"     # same data, different body
+    if updated is not None:
+        updated = updated.replace(tzinfo=timezone.utc, microsecond=0)
+    return etag, updated
+
+
+def _not_modified(etag, updated):
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    ims = request.if_modified_since
+    return bool(ims and updated and updated <= ims)
+
+
+def conditional(*names):
+    """Attach ETag / Last-Modified and short-circuit with 304 when unchanged"""
+    def decorator(f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET":
+                return f(*args, **kwargs)
+
+            try:
+                etag, updated = _validators(names)
+            except Exception as e:
+                print("⚠️ Version lookup failed:", e)
+                return f(*args, **kwargs)
+
+            if _not_modified(etag, updated):
+                resp = Response(status=304)
+            else:
+                resp = make_response(f(*args, **kwargs))
+                if resp.status_code != 200:
+                    return resp
+
+            resp.set_etag(etag, weak=True)
+            if updated is not None:
+                resp.last_modified = updated
+            resp.headers["Cache-Control"] = "no-cache"
+            resp.vary.add("Accept")
+            return resp
+        return wrapper
+    return decorator